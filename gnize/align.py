@@ -0,0 +1,122 @@
+"""
+# Purpose
+
+This module finds where each subcanvas of a recognized canvas sits in the
+noise.
+
+Aligning a whole canvas against the whole noise (Needleman-Wunsch) takes
+time and memory proportional to the product of their lengths, which is
+too much for a few pages of text.  But recog has already found a chain of
+fingerprints which appear in order in both (see recog.chain), and each of
+them pins a piece of the canvas to a piece of the noise.  Only the short
+gaps between those anchors (and the ends of each subcanvas, before the
+first anchor and after the last) need to be aligned, and since the text
+on either side of a gap is known to line up, the alignment can stay
+within a narrow band around the diagonal.
+
+    canvas:   [head]  anchor  [gap]  anchor  [gap]  anchor  [tail]
+    noise:  ..[head]  anchor  [gap ]  anchor [gap]  anchor  [tail]..
+
+So the cost is roughly linear in the length of the noise.
+"""
+
+from collections import namedtuple
+from typing import List
+
+# subcanvas number canvas was found at noise[begin:end] with this many edits
+Span = namedtuple("Span", "canvas begin end edits")
+
+
+def banded(a: str, b: str, band: int, free_end=False):
+    """
+    The edit distance between a and b, considering only the cells within
+    band of the diagonal.  If free_end, b may be cut short wherever that
+    is cheapest (use this to extend outward from an anchor).
+
+    Returns (edits, characters of b used)
+    """
+
+    n, m = len(a), len(b)
+    if not free_end:
+        band += abs(n - m)
+    worst = n + m + 1
+
+    previous = {j: j for j in range(0, min(m, band) + 1)}
+    for i in range(1, n + 1):
+        current = {}
+        for j in range(max(0, i - band), min(m, i + band) + 1):
+            best = previous.get(j, worst) + 1
+            if j:
+                best = min(
+                    best,
+                    current.get(j - 1, worst) + 1,
+                    previous.get(j - 1, worst) + (a[i - 1] != b[j - 1]),
+                )
+            current[j] = best
+        previous = current
+
+    if free_end:
+        used = min(previous, key=lambda j: (previous[j], abs(j - n)))
+        return previous[used], used
+    return previous.get(m, worst), m
+
+
+def verified(noise: str, subcanvas: str, m) -> bool:
+    "fingerprints can collide, an anchor has to actually match"
+    return noise[m.begin : m.end] == subcanvas[m.sub_idx : m.sub_idx + m.len]
+
+
+def locate(noise: str, canvas: List[str], matches: List, band=8) -> List[Span]:
+    """
+    Given a chain of matches (see recog.chain), find the noise that
+    corresponds to each subcanvas that has at least one anchor
+    """
+
+    found = []
+    for number, subcanvas in enumerate(canvas):
+
+        anchors = [
+            m for m in matches if m.canvas == number and verified(noise, subcanvas, m)
+        ]
+        anchors.sort(key=lambda m: m.begin)
+
+        # overlapping anchors would make the gap between them negative
+        disjoint = []
+        for m in anchors:
+            if not disjoint or (
+                m.begin >= disjoint[-1].end
+                and m.sub_idx >= disjoint[-1].sub_idx + disjoint[-1].len
+            ):
+                disjoint.append(m)
+        if not disjoint:
+            continue
+
+        edits = 0
+        first, last = disjoint[0], disjoint[-1]
+
+        # extend leftward from the first anchor
+        head = subcanvas[: first.sub_idx]
+        window = noise[max(0, first.begin - len(head) - band) : first.begin]
+        cost, used = banded(head[::-1], window[::-1], band, free_end=True)
+        begin = first.begin - used
+        edits += cost
+
+        # align the gaps between anchors
+        for left, right in zip(disjoint, disjoint[1:]):
+            cost, _ = banded(
+                subcanvas[left.sub_idx + left.len : right.sub_idx],
+                noise[left.end : right.begin],
+                band,
+            )
+            edits += cost
+
+        # extend rightward from the last anchor
+        tail = subcanvas[last.sub_idx + last.len :]
+        window = noise[last.end : last.end + len(tail) + band]
+        cost, used = banded(tail, window, band, free_end=True)
+        end = last.end + used
+        edits += cost
+
+        found.append(Span(number, begin, end, edits))
+
+    return found
@@ -0,0 +1,157 @@
+"""
+# Purpose
+
+This module implements a Bloom filter which lives next to the fingerprint
+store (~/.gnize/fingerprints.bloom).
+
+Most of the fingerprints that a recognizer calculates come from noise, so
+they won't match anything that has been cognized.  Asking sqlite about
+each of them is wasteful.  The filter answers "definitely not stored" in
+memory, so only the plausible fingerprints become database queries.
+
+Both prefixes and whole fingerprints (prefix->feature) are added, so a
+recognizer can discard a boring prefix before it even considers the
+features that follow it.
+
+The file is a small header followed by the bit array.  It is mapped into
+memory, so opening it is cheap no matter how large it gets, and new bits
+are written in place as canvasses are cognized.
+"""
+
+import math
+import mmap
+import struct
+from hashlib import blake2b
+from pathlib import Path
+
+magic = b"GNBF"
+header = struct.Struct(">4sIQQQ")  # magic, hashes, bits, capacity, count
+
+
+def prefix_token(channel: int, prefix: int) -> bytes:
+    return b"p" + _int_bytes(channel) + b":" + _int_bytes(prefix)
+
+
+def print_token(channel: int, prefix: int, feature: int) -> bytes:
+    return (
+        b"f"
+        + _int_bytes(channel)
+        + b":"
+        + _int_bytes(prefix)
+        + b"->"
+        + _int_bytes(feature)
+    )
+
+
+def _int_bytes(i: int) -> bytes:
+    return i.to_bytes(max(1, math.ceil(i.bit_length() / 8)), byteorder="big")
+
+
+def dimensions(capacity: int, error_rate: float):
+    "how many bits and hash functions for this many items at this error rate"
+
+    bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+    bits = max(64, 8 * math.ceil(bits / 8))
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+class BloomFilter:
+    """
+    A persisted, memory-mapped set of tokens which may report false
+    positives but never false negatives
+    """
+
+    def __init__(self, path, capacity=1 << 20, error_rate=0.01):
+
+        self.path = Path(path)
+        self.error_rate = error_rate
+
+        if not self.path.exists():
+            self._create(capacity)
+
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        found, self.hashes, self.bits, self.capacity, _ = header.unpack_from(
+            self._map, 0
+        )
+        if found != magic:
+            self.close()
+            raise ValueError(f"{self.path} is not a gnize bloom filter")
+
+    def _create(self, capacity):
+        bits, hashes = dimensions(capacity, self.error_rate)
+        with open(self.path, "wb") as f:
+            f.write(header.pack(magic, hashes, bits, capacity, 0))
+            f.truncate(header.size + bits // 8)
+
+    @property
+    def count(self):
+        return header.unpack_from(self._map, 0)[4]
+
+    @property
+    def saturated(self):
+        "more items than it was sized for, false positives are climbing"
+        return self.count > self.capacity
+
+    def _positions(self, token: bytes):
+        # double hashing: position_i = h1 + i * h2
+        digest = blake2b(token, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], byteorder="big")
+        h2 = int.from_bytes(digest[8:], byteorder="big") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, token: bytes):
+        for position in self._positions(token):
+            byte = header.size + (position >> 3)
+            self._map[byte] |= 1 << (position & 7)
+        header.pack_into(
+            self._map,
+            0,
+            magic,
+            self.hashes,
+            self.bits,
+            self.capacity,
+            self.count + 1,
+        )
+
+    def __contains__(self, token: bytes):
+        for position in self._positions(token):
+            byte = header.size + (position >> 3)
+            if not self._map[byte] & (1 << (position & 7)):
+                return False
+        return True
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def rebuild(path, tokens, capacity, error_rate=0.01) -> BloomFilter:
+    """
+    Replace the filter at path with a fresh one, sized for capacity, which
+    contains each of the given tokens
+    """
+
+    path = Path(path)
+    staging = path.with_suffix(path.suffix + ".new")
+    if staging.exists():
+        staging.unlink()
+
+    with BloomFilter(staging, capacity=capacity, error_rate=error_rate) as bf:
+        for token in tokens:
+            bf.add(token)
+        bf.flush()
+
+    staging.replace(path)
+    return BloomFilter(path, error_rate=error_rate)
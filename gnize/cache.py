@@ -0,0 +1,86 @@
+"""
+# Purpose
+
+This module remembers what all_subs found, so that fingerprinting the same
+text with the same parameters a second time is just a file read.
+
+Results are kept in a directory (~/.gnize/cache by default), one file per
+result.  The file is named for the multihash of the text together with the
+parameters that affect which fingerprints are found, so a change to either
+one misses the cache rather than returning stale fingerprints.
+
+Reading a result bumps its modification time, and whenever a result is
+written the least recently used files are deleted until the directory is
+back under its size cap.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import multihash
+
+# see dotdir.dir_path
+default_path = Path.home() / ".gnize" / "cache"
+default_capacity = 64 << 20
+
+# bump this when the file format (see all_subs and Fingerprints.to_bytes)
+# changes, or when the same settings would now find different fingerprints
+version = 3
+
+
+def key(target: str, settings: dict) -> str:
+    "a name for the result of fingerprinting target with these settings"
+
+    identity = json.dumps([version, settings, target], sort_keys=True)
+    digest = hashlib.sha256(identity.encode("utf-8")).digest()
+    return multihash.to_b58_string(multihash.encode(digest, "sha2-256"))
+
+
+def load(path, name: str) -> Optional[bytes]:
+    "the cached result, or None"
+
+    entry = Path(path) / name
+    try:
+        data = entry.read_bytes()
+    except FileNotFoundError:
+        return None
+
+    # reading counts as a use, see evict
+    entry.touch()
+    return data
+
+
+def save(path, name: str, data: bytes, capacity=default_capacity):
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    # write then rename, so a concurrent reader never sees half a result
+    staging = path / f"{name}.{os.getpid()}.new"
+    staging.write_bytes(data)
+    staging.replace(path / name)
+
+    evict(path, capacity)
+
+
+def evict(path, capacity=default_capacity):
+    "delete the least recently used results until they fit in capacity bytes"
+
+    entries = []
+    for entry in os.scandir(path):
+        if entry.is_file() and not entry.name.endswith(".new"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= capacity:
+            break
+        try:
+            os.unlink(name)
+        except FileNotFoundError:
+            pass  # another process evicted it first
+        total -= size
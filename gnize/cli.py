@@ -1,9 +1,11 @@
 import sys
 import select
 import argparse
-from gnize.features import all_subs, Params as GnizeParams
-from gnize.cog import make_canvas
-from gnize import galois
+from gnize import serve
+
+# Everything else is imported by the command that needs it, so that
+# `echo foo | gn` doesn't wait on the TUI (which sets itself up when it's
+# imported) or the fingerprint store.  See tests/test_cli.py
 
 def _read_stdin():
 
@@ -20,25 +22,91 @@ def _read_stdin():
 def gn():
 
     parser = argparse.ArgumentParser(description="read stdin, write gnize fingerprints")
+    parser.add_argument("command", nargs="?", choices=["serve"])
     parser.add_argument("-t", "--stats", action="store_true")
     parser.add_argument("-n", "--no-prints", action="store_true")
     parser.add_argument("-a", "--all", action="store_true")
     parser.add_argument("-s", "--serial", action="store_true")
+    parser.add_argument("-c", "--no-cache", action="store_true")
+    parser.add_argument("-d", "--density", type=float)
+    parser.add_argument("-w", "--winnow", action="store_true")
+    parser.add_argument("-S", "--socket", nargs="?", const=str(serve.default_socket))
+    parser.add_argument("--reindex", action="store_true")
 
     args = parser.parse_args()
-    params = GnizeParams()
+
+    # gn serve => run a daemon for clients (gn -S) to talk to
+    if args.command == "serve":
+        serve.serve(args.socket or serve.default_socket)
+        return
+
+    # --reindex => count the canvasses and fingerprints again, rather than
+    # trusting the totals that were kept as they were stored
+    if args.reindex:
+        from gnize import dotdir
+        from gnize.store import reindex
+
+        canvasses, prints = reindex(dotdir.make_or_get())
+        print(
+            f"reindexed: {canvasses} canvasses, {prints} fingerprints", file=sys.stderr
+        )
+        return
 
     message = _read_stdin()
 
+    overrides = {}
+
+    # -c => fingerprint from scratch, even if this message has been seen before
+    if args.no_cache:
+        overrides.update(cache=None)
+
     # -a => print every fingerprint, not just the interesting ones
     if args.all:
-        params.max_prefix_len = 0
-        params.skip_prefix = True
-        params.prefix_threshold = 0xFFFF
-        params.feature_threshold = 0xFFFF
+        overrides.update(
+            max_prefix_len=0,
+            skip_prefix=True,
+            prefix_threshold=0xFFFF,
+            feature_threshold=0xFFFF,
+        )
+
+    # -d N => pick thresholds that find N fingerprints per 1000 characters
+    if args.density:
+        overrides.update(selection="quantile", target_density=args.density)
+
+    # -w => select by winnowing instead, at least one per window
+    if args.winnow:
+        overrides.update(selection="winnow")
 
     if args.serial:
-        params.parallel = False
+        overrides.update(parallel=False)
+
+    # -S => let the daemon do it
+    if args.socket:
+        request = {
+            "op": "fingerprint",
+            "texts": [message],
+            "params": overrides,
+            "format": "text" if sys.stdout.isatty() else "json",
+        }
+        for response in serve.request(args.socket, request):
+            if not args.no_prints:
+                print(response["fingerprints"])
+            if args.stats:
+                print(response["stats"], file=sys.stderr)
+        return
+
+    from gnize import cache
+    from gnize.features import all_subs, Params as GnizeParams
+
+    params = GnizeParams(**dict({"cache": cache.default_path}, **overrides))
+
+    if params.parallel:
+        import logging
+
+        logging.basicConfig(
+            level=logging.DEBUG,
+            format="%(relativeCreated)6d %(threadName)s %(message)s",
+        )
 
     fingerprints, stats = all_subs(message, params)
 
@@ -61,5 +129,65 @@ def cog():
     args = parser.parse_args()
 
     noise = _read_stdin()
+
+    from gnize.cog import make_canvas
+
     signal = make_canvas(noise, args)
 
+
+def recog():
+
+    parser = argparse.ArgumentParser(description="read stdin, find cognized signals in the noise")
+    parser.add_argument("-s", "--serial", action="store_true")
+    parser.add_argument("-k", "--limit", type=int, default=10)
+    parser.add_argument("-l", "--locate", action="store_true")
+    parser.add_argument("-S", "--socket", nargs="?", const=str(serve.default_socket))
+    args = parser.parse_args()
+
+    noise = _read_stdin()
+
+    # -S => ask the daemon (see gn serve), which has the store open already
+    if args.socket:
+        request = {
+            "op": "recog",
+            "noise": noise,
+            "limit": args.limit,
+            "locate": args.locate,
+            "params": {"parallel": not args.serial},
+        }
+        from gnize.align import Span
+
+        for response in serve.request(args.socket, request):
+            for chain_len, votes, canvas_hash, spans in response["candidates"]:
+                _print_candidate(chain_len, votes, canvas_hash, [Span(*s) for s in spans])
+        return
+
+    from gnize import dotdir
+    from gnize.align import locate
+    from gnize.features import Params as GnizeParams
+    from gnize.recog import recog as recognize
+    from gnize.store import open_store, read_canvas
+
+    params = GnizeParams()
+
+    if args.serial:
+        params = params.replace(parallel=False)
+
+    config = dotdir.make_or_get()
+    with open_store(config) as store:
+        for candidate in recognize(noise, store, params, args.limit):
+
+            # -l => show where each subcanvas was found
+            spans = []
+            if args.locate:
+                canvas = read_canvas(config, candidate.canvas_hash)
+                spans = locate(noise, canvas, candidate.chain)
+
+            _print_candidate(len(candidate.chain), candidate.votes, candidate.canvas_hash, spans)
+
+
+def _print_candidate(chain_len, votes, canvas_hash, spans):
+
+    print(f"{chain_len}\t{votes:.2f}\t{canvas_hash}")
+    for span in spans:
+        print(f"\t{span.canvas}\t{span.begin}:{span.end}\tedits: {span.edits}")
@@ -62,6 +62,7 @@ from typing import Iterator, List, Tuple, Union, Optional
 import traceback
 import yaml
 from intervaltree import Interval, IntervalTree
+from sortedcontainers import SortedDict
 from tabulate import tabulate
 
 from gnize import dotdir
@@ -112,43 +113,45 @@ class Data:
         self, interval: Interval, cursor_start=0, cursor_stop=None
     ) -> List[CharState]:
 
-        selection_end = cursor_stop or cursor_start or 1
-        selection = Interval(begin=cursor_start or 0, end=cursor_stop or cursor_start)
-        unabridged = []
-        for i, c in enumerate(interval.data.data):
-            idx = i + interval.begin
-            if c.isspace():
-                c = " "
-
-            selected = selection.contains_point(idx)
+        # the selection covers [selection_begin, selection_end)
+        selection_begin = cursor_start or 0
+        selection_end = cursor_stop or cursor_start or 0
+
+        def selected(begin, end):
+            "does the selection overlap interval characters begin to end - 1"
+            begin += interval.begin
+            end += interval.begin
+            return (
+                selection_begin < selection_end
+                and selection_begin < end
+                and begin < selection_end
+            )
 
-            color = subcanvas_color[interval.data.kind]
-            if selected:
-                color = f"{color} bold"
+        color = subcanvas_color[interval.data.kind]
 
-            unabridged.append(
-                CharState(
-                    selected=selected,
-                    kind=interval.data.kind,
-                    char=c,
-                    styled_char=(color, c),
-                )
+        def char_state(i):
+            c = interval.data.data[i]
+            if c.isspace():
+                c = " "
+            is_selected = selected(i, i + 1)
+            return CharState(
+                selected=is_selected,
+                kind=interval.data.kind,
+                char=c,
+                styled_char=(f"{color} bold" if is_selected else color, c),
             )
 
         width = 10
         part = int(width / 2) - 1
+        length = len(interval.data.data)
 
-        if len(unabridged) > width:
-            start = unabridged[:part]
-            end = unabridged[-part:]
-            omitted = unabridged[part:-part]
-
-            if any(filter(lambda x: x.selected, omitted)):
-                standin_selected = True
-            else:
-                standin_selected = False
+        # only the characters that are shown get a CharState
+        if length > width:
+            start = [char_state(i) for i in range(part)]
+            end = [char_state(i) for i in range(length - part, length)]
 
-            if any(filter(lambda x: x.kind == Kind.signal, unabridged)):
+            standin_selected = selected(part, length - part)
+            if interval.data.kind == Kind.signal:
                 standin_kind = Kind.signal
             else:
                 standin_kind = Kind.noise
@@ -163,7 +166,7 @@ class Data:
             ]
 
         else:
-            start = unabridged
+            start = [char_state(i) for i in range(length)]
             end = []
             standin = []
 
@@ -182,6 +185,105 @@ class Error:
         return (self.original + self.user_change) < other
 
 
+class Runs:
+    """
+    The kind of each character of the noise, kept as runs: the offset
+    where each run begins, mapped to its kind.  There are as many runs as
+    there are subcanvasses, however long the noise is, so reading or
+    changing a range of kinds costs a search plus a step per run.
+    """
+
+    def __init__(self, length=0, kind=Kind.signal):
+        self.length = length
+        self.starts = SortedDict({0: kind} if length else {})
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return " ".join(f"{b}-{e}:{kind.name}" for b, e, kind in self.spans())
+
+    def copy(self):
+        runs = Runs()
+        runs.length = self.length
+        runs.starts = self.starts.copy()
+        return runs
+
+    def kind_at(self, i: int) -> Kind:
+        return self.starts.peekitem(self.starts.bisect_right(i) - 1)[1]
+
+    def run(self, i: int) -> Tuple[int, int, Kind]:
+        "(begin, end, kind) of the run that character i is in"
+        begin, kind = self.starts.peekitem(self.starts.bisect_right(i) - 1)
+        return begin, self._run_end(begin), kind
+
+    def spans(self, begin=0, end=None) -> Iterator[Tuple[int, int, Kind]]:
+        "(begin, end, kind) for each run, clipped to begin and end"
+
+        end = self.length if end is None else min(end, self.length)
+        if begin >= end:
+            return
+        first = self.starts.bisect_right(begin) - 1
+        for run_begin, kind in self.starts.items()[first:]:
+            if run_begin >= end:
+                return
+            run_end = self._run_end(run_begin)
+            yield max(begin, run_begin), min(end, run_end), kind
+
+    def _run_end(self, run_begin: int) -> int:
+        following = self.starts.bisect_right(run_begin)
+        if following < len(self.starts):
+            return self.starts.peekitem(following)[0]
+        return self.length
+
+    def kinds(self) -> Iterator[Kind]:
+        "one kind per character"
+        for begin, end, kind in self.spans():
+            for _ in range(begin, end):
+                yield kind
+
+    def assign(self, begin: int, end: int, kind: Kind):
+        "mark characters begin through end - 1 as kind"
+
+        end = min(end, self.length)
+        if begin >= end:
+            return
+
+        # the run that end falls in continues past it
+        if end < self.length and end not in self.starts:
+            self.starts[end] = self.kind_at(end)
+
+        for start in list(self.starts.irange(begin, end, inclusive=(True, False))):
+            del self.starts[start]
+        self.starts[begin] = kind
+
+        # merge with neighbors of the same kind
+        if self.starts.get(end) == kind:
+            del self.starts[end]
+        if begin and self.kind_at(begin - 1) == kind:
+            del self.starts[begin]
+
+
+def common_prefix(a: str, b: str, block=4096) -> int:
+    "how many characters a and b have in common at the front"
+
+    n = min(len(a), len(b))
+    i = 0
+
+    # skip a block at a time (compared at C speed), then find the difference
+    while i < n and a[i : min(i + block, n)] == b[i : min(i + block, n)]:
+        i = min(i + block, n)
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def common_suffix(a: str, b: str, block=4096) -> int:
+    "how many characters a and b have in common at the back"
+
+    return common_prefix(a[::-1], b[::-1], block)
+
+
 def find_targeted(
     orig: str,
     change: str,
@@ -208,120 +310,80 @@ def find_targeted(
     def dbg(message):
         debug(indent(str(message), prefix="           "))
 
-    # is this what the user deleted?
-    def fits(ranges):
-
-        # what would go?
-        maybe_deleted = []
-        for r in ranges:
-            maybe_deleted.append(orig[r[0] : r[1]])
-        maybe_deleted_str = "\n--\n".join(maybe_deleted)
-        range_str = ",".join([f"{x[0]}-{x[1]}" for x in ranges])
-        dbg(
-            f"candidate deletion {range_str}:\n"
-            + indent(maybe_deleted_str, prefix="  ")
-        )
-
-        # what would stay?
-        preserved = []
-        end = len(noise)
-        dbg("preserving")
-        for prev_r, r in zip([(None, None)] + ranges, ranges):
-            start = prev_r[1] or 0
-            end = r[0]
-            p_range = noise[start:end]
-            dbg(indent(p_range, prefix="  "))
-            preserved.append(p_range)
-            dbg("  --")
-        p_range = noise[end + 1 :]
-        dbg(indent(p_range, prefix="  "))
-        preserved.append(p_range)
-        preserved_str = "".join(preserved)
-
-        # show what's being compared
-        comparisons = "\n--\n".join([change, preserved_str])
-        dbg(f"comparing:\n" + indent(comparisons, prefix="  "))
-
-        # if what would change is what actually changed
-        if preserved_str == change:
-            return True
-
     # if the user added characters (perhaps by a yank/put)
     # revert states, mark no changes
-    if not lost_characters:
+    if lost_characters <= 0:
         return ([], None)
 
-    # walk the deleted range
-    # see which manipuluation to the noise makes it match the change
-    candidate = None
-    min_start = cursor_pos - lost_characters
+    # orig[:i] + orig[i + lost_characters:] == change holds for every i
+    # that leaves the common prefix and suffix intact, which is a range
+    # (more than one i when the deletion borders a repeated character)
+    prefix = common_prefix(orig, change)
+    suffix = common_suffix(orig, change)
+    first = max(0, len(change) - suffix)
+    last = prefix
 
-    # maybe it started at the cursor position (x, dw, d$)
-    candidate = (cursor_pos, cursor_pos + lost_characters)
-    if fits([candidate]):
-        dbg(f"marking from {candidate[0]} to {candidate[1]} ")
-        return ([candidate], None)
-
-    # maybe it started before the cursor position (dd, diw)
-    else:
-        for i in range(min_start, cursor_pos):
-            if i >= 0:
-                maybe_deleted = noise[i : i + lost_characters]
-                dbg(f"trying: {min_start + i}-{cursor_pos}: ({maybe_deleted})")
-                precandidate = (
-                    change[i:cursor_pos] + change[cursor_pos + lost_characters - 1 :]
-                )
+    candidate = None
+    if first <= last:
 
-                if noise[:i] + noise[i + lost_characters] == change:
-                    candidate = (i, i + lost_characters)
-                    break
+        # prefer a deletion at the cursor (x, dw, d$), or else the closest
+        # one before it (dd, diw)
+        start = min(max(cursor_pos, first), last)
+        if start != cursor_pos:
+            start = min(max(cursor_pos - lost_characters, first), last)
+        candidate = (start, start + lost_characters)
 
-    if candidate and len(prev_selections) <= 1:
+    if candidate and len(prev_selections or []) <= 1:
         # if there were not previously multiple selections, then the
         # above match is correct, and so is the cursor position
         dbg(f"marking from {candidate[0]} to {candidate[1]} ")
         return ([candidate], None)
 
-    else:
-        # otherwise, try deleting all previous selections
-        fragments = []
-        for prev_sel, sel in zip([(None, None)] + prev_selections, prev_selections):
-            not_del_start = prev_sel[1] or 0
-            not_del_end = sel[0]
-            fragments.append(noise[not_del_start:not_del_end])
-        fragments = "".join(fragments)
-
-        if "".join(fragments) == change:
-            dbg(f"           marking previous selection")
-            return (prev_selections, None)
-
-        elif candidate:
-            # or maybe the previous selections are irrelevant
-            # go with the candidate found above
-            dbg(f"           marking from {candidate[0]} to {candidate[1]} ")
-            return ([candidate], None)
+    # otherwise, try deleting all previous selections
+    if prev_selections and deletes(orig, change, prev_selections):
+        dbg(f"marking previous selection")
+        return (prev_selections, None)
+
+    elif candidate:
+        # or maybe the previous selections are irrelevant
+        # go with the candidate found above
+        dbg(f"marking from {candidate[0]} to {candidate[1]} ")
+        return ([candidate], None)
 
     raise NotImplementedError("failed to target changes")
 
-    # first assume that there was only one change
+
+def deletes(orig: str, change: str, ranges: List[Tuple[int, int]]) -> bool:
+    "is change what's left of orig once these (sorted) ranges are deleted"
+
+    if len(orig) - sum(end - begin for begin, end in ranges) != len(change):
+        return False
+
+    # compare what's kept, piece by piece, in place
+    position = 0
+    kept_from = 0
+    for begin, end in list(ranges) + [(len(orig), len(orig))]:
+        kept = orig[kept_from:begin]
+        if not change.startswith(kept, position):
+            return False
+        position += len(kept)
+        kept_from = end
+    return True
 
 
-def toggled(noise, state, toggled_ranges) -> List[Kind]:
+def toggled(noise, state, toggled_ranges) -> Runs:
     "The user has indicated a range, change the state for those chars"
 
     # initialize all chars as signal if no state is found
     if not state:
         debug(f"TOGGLED: state is uninitialized, marking all signal")
-        return [Kind.signal for _ in noise]
+        return Runs(len(noise))
 
     # which states are changing?
     targeted_states = set()
-    targeted_indices = set()
-    for i, s in enumerate(state):
-        for tr in toggled_ranges:
-            if i in tr:
-                targeted_indices.add(i)
-                targeted_states.add(s)
+    for begin, end in toggled_ranges:
+        for _, _, kind in state.spans(begin, end):
+            targeted_states.add(kind)
 
     # if none, exit early
     if not targeted_states:
@@ -335,8 +397,10 @@ def toggled(noise, state, toggled_ranges) -> List[Kind]:
         disposition = Kind.signal
     debug(f"         marking as {disposition}")
 
-    for i in targeted_indices:
-        state[i] = disposition
+    # leave the previous state as it was, in case it's needed again
+    state = state.copy()
+    for begin, end in toggled_ranges:
+        state.assign(begin, end, disposition)
     return state
 
 
@@ -344,34 +408,37 @@ signal_kinds = [Kind.signal, Kind.parameter]
 noise_kinds = [Kind.noise]
 
 
-prev_char_states = []
-char_states = []
+prev_char_states = Runs()
+char_states = Runs()
 debug_display = FormattedTextControl(text="")
 
 
 def charstate_str():
-    return "".join([{Kind.signal: "s", Kind.noise: "n"}[x] for x in char_states])
+    return "".join(
+        {Kind.signal: "s", Kind.noise: "n"}[kind] + str(end - begin)
+        for begin, end, kind in char_states.spans()
+    )
 
 
 class SubcanvasLexer(Lexer):
 
-    char_states: List[Kind] = []
+    char_states = Runs()
 
     def lex_document(self, document):
         def get_line(lineno):
 
+            line = document.lines[lineno]
             line_start = line_start_idx[lineno]
 
-            formatted_chars = [None] * len(document.lines[lineno])
-
-            # set colors for this line
-            for i, c in enumerate(document.lines[lineno]):
-                char_no = line_start + i
-                char_kind = SubcanvasLexer.char_states[char_no]
-                char_color = subcanvas_color[char_kind]
-                formatted_chars[i] = (char_color, c)
+            # one fragment per run of the same kind on this line
+            formatted = []
+            for begin, end, kind in SubcanvasLexer.char_states.spans(
+                line_start, line_start + len(line)
+            ):
+                text = line[begin - line_start : end - line_start]
+                formatted.append((subcanvas_color[kind], text))
 
-            return formatted_chars
+            return formatted
 
         return get_line
 
@@ -382,9 +449,22 @@ class SubcanvasSummaryLexer(Lexer):
     cursor_stop = None
     it: IntervalTree = None
 
+    # bump this whenever it changes, see ordered
+    version = 0
+    _ordered = (None, [])
+
+    @staticmethod
+    def ordered() -> List[Interval]:
+        "it, sorted, as of the current version"
+
+        cls = SubcanvasSummaryLexer
+        if cls._ordered[0] != cls.version:
+            cls._ordered = (cls.version, sorted(cls.it))
+        return cls._ordered[1]
+
     def lex_document(self, document):
         def get_line(lineno):
-            interval = sorted(SubcanvasSummaryLexer.it)[lineno]
+            interval = SubcanvasSummaryLexer.ordered()[lineno]
             summary = interval.data.summary(
                 interval,
                 cursor_start=SubcanvasSummaryLexer.cursor_start,
@@ -426,7 +506,7 @@ def format_event(event, previous_event=None):
         return buf.getvalue()
 
 
-subcanvasses = []
+subcanvasses = IntervalTree()
 subcanvas_summaries = Buffer()
 subcanvasses_display = BufferControl(
     buffer=subcanvas_summaries, lexer=SubcanvasSummaryLexer()
@@ -491,11 +571,17 @@ def update(event):
 
             # update which characters are in/excluded based on what changed
             debug("char_states: " + str(char_states))
+            previous = char_states
             char_states = toggled(noise, char_states, targeted_ranges)
 
             # show user recent changes
             try:
-                intervals = get_subcanvasses(noise, char_states)
+                if not previous:
+                    subcanvasses = get_subcanvasses(noise, char_states)
+                    SubcanvasSummaryLexer.version += 1
+                elif char_states is not previous:
+                    resubcanvas(noise, subcanvasses, char_states, targeted_ranges)
+                    SubcanvasSummaryLexer.version += 1
             except AlignmentError as err:
                 debug_next(str(err))
                 buffer.text = noise
@@ -503,13 +589,11 @@ def update(event):
             else:
 
                 SubcanvasLexer.char_states = char_states
-                SubcanvasSummaryLexer.it = intervals
+                SubcanvasSummaryLexer.it = subcanvasses
 
                 # show the user which characters are of which kind
                 buffer.text = noise
 
-                subcanvasses = sorted(intervals)
-
                 def update_subcanvas_summaries(cursor_start, cursor_stop=None):
                     global subcanvas_summaries
 
@@ -530,8 +614,8 @@ def update(event):
 
                 # give interval starts, lexer will replace each with a summary
                 interval_starts = []
-                for subcanvas in subcanvasses:
-                    interval_starts.append(str(subcanvas.begin))
+                for begin in char_states.starts:
+                    interval_starts.append(str(begin))
                 subcanvas_summaries.text = "\n".join(interval_starts)
 
                 # if not cursor_position_override:
@@ -583,10 +667,8 @@ class AlignmentError(Exception):
     pass
 
 
-def get_subcanvasses(noise, charstate) -> IntervalTree:
-
-    if charstate == None:
-        charstate = [Kind.signal] * len(noise)
+def aligned(noise, charstate):
+    "complain unless there's a charstate for each character of noise"
 
     if len(noise) != len(charstate):
         raise AlignmentError(
@@ -595,38 +677,49 @@ def get_subcanvasses(noise, charstate) -> IntervalTree:
                 we need a charstate for each noise char
                 {noise} (len: {len(noise)})
                   !=
-                {char_states} (len: {len(char_states)})
+                {charstate} (len: {len(charstate)})
                 """
             )
         )
 
-    it = IntervalTree()
-    begin = 0
-    end = 0
-    next_kind = None
 
-    def gobble(kind, begin):
-        "reached kind boundary, create a subcanvas for previous stuff"
-        debug(f"gobbling from {begin} to {end} for {kind}:")
-        debug(indent(noise[begin:end], prefix="    "))
+def get_subcanvasses(noise, charstate) -> IntervalTree:
+
+    if charstate == None:
+        charstate = Runs(len(noise))
+    aligned(noise, charstate)
 
+    # each run of the same kind is a subcanvas
+    it = IntervalTree()
+    for begin, end, kind in charstate.spans():
+        debug(f"gobbling from {begin} to {end} for {kind}")
         it[begin:end] = Data(kind=kind, data=noise[begin:end])
-        begin = end + 1
 
-    # for each char, maybe generate subcanvas for whatever preceeds it
-    for i, _ in enumerate(noise):
-        current = charstate[i]
-        end = i + 1
-        try:
-            next_kind = charstate[i + 1]
-        except IndexError:
-            gobble(current, begin)
+    return it
 
-        if current and current != next_kind:
-            gobble(current, begin)
-            begin = i + 1
 
-    return it
+def resubcanvas(noise, it: IntervalTree, charstate, toggled_ranges):
+    """
+    Bring the subcanvasses in it up to date with charstate, which differs
+    from what they were made from only in toggled_ranges
+    """
+
+    aligned(noise, charstate)
+    if not noise or not toggled_ranges:
+        return
+
+    begin = max(0, min(begin for begin, _ in toggled_ranges))
+    end = min(len(noise), max(end for _, end in toggled_ranges))
+
+    # whatever split or merged is within the runs on either side of the
+    # toggled ranges, now that they've been toggled
+    lo = charstate.run(max(min(begin, end) - 1, 0))[0]
+    hi = charstate.run(min(end, len(noise) - 1))[1]
+
+    it.remove_envelop(lo, hi)
+    for run_begin, run_end, kind in charstate.spans(lo, hi):
+        debug(f"gobbling from {run_begin} to {run_end} for {kind}")
+        it[run_begin:run_end] = Data(kind=kind, data=noise[run_begin:run_end])
 
 
 legend_left = dedent(
@@ -692,10 +785,10 @@ def debug_dump():
         f.write(
             yaml.dump(
                 {
-                    "states": list(
-                        map(list, zip(noise, [x.name for x in char_states]))
-                    ),
-                    "subcanvasses": [x.data.data for x in subcanvasses],
+                    "states": [
+                        [c, kind.name] for c, kind in zip(noise, char_states.kinds())
+                    ],
+                    "subcanvasses": [x.data.data for x in sorted(subcanvasses)],
                 }
             )
         )
@@ -773,7 +866,8 @@ def make_canvas(_noise, args):
 
     root_container = HSplit(ui)
 
-    subcanvasses.append(Data(Kind.signal, noise))
+    if noise:
+        subcanvasses[0 : len(noise)] = Data(Kind.signal, noise)
 
     # start with the input noise as the signal
     buffer.text = noise
@@ -3,10 +3,8 @@ from pathlib import Path
 from textwrap import dedent
 from dataclasses import dataclass, field
 from dataclasses_json import dataclass_json
-import multihash
 import json
 from dacite import from_dict
-import sqlite3
 import sys
 
 
@@ -34,6 +32,9 @@ class FingerprintStore:
     use: str
     connect: str
 
+    # fingerprints found in more canvasses than this are ignored by recog
+    stop_frequency: int = 100
+
 
 @dataclass_json
 @dataclass
@@ -74,6 +75,7 @@ default_config = from_dict(
         "fingerprints": {
             "use": "sqlite3",
             "connect": str(dir_path / "fingerprints.db"),
+            "stop_frequency": 100,
         },
         "colors": {
             "gaps": {"primary": "#b58900", "secondary": "#cb4b16"},
@@ -87,6 +89,87 @@ default_config = from_dict(
 )
 
 
+def create_tables(conn):
+    "the fingerprint store's schema"
+
+    cursor = conn.cursor()
+    cursor.execute(
+        dedent(
+            """
+            CREATE TABLE IF NOT EXISTS prints (
+                channel INTEGER NOT NULL,
+                fingerprint INTEGER NOT NULL,
+                repeat_num INTEGER NOT NULL DEFAULT 0,
+                canvas_hash TEXT NOT NULL,
+                canvas sub INTEGER NOT NULL,
+                sub_idx INTEGER NOT NULL,
+                len INTEGER NOT NULL,
+                PRIMARY KEY (channel, fingerprint, repeat_num)
+            );
+            """
+        )
+    )
+
+    # how many canvasses have each fingerprint
+    cursor.execute(
+        dedent(
+            """
+            CREATE TABLE IF NOT EXISTS frequency (
+                channel INTEGER NOT NULL,
+                fingerprint INTEGER NOT NULL,
+                canvasses INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (channel, fingerprint)
+            );
+            """
+        )
+    )
+
+    # fingerprints from degree 63 channels don't fit in one 64 bit column
+    cursor.execute(
+        dedent(
+            """
+            CREATE TABLE IF NOT EXISTS wide_prints (
+                channel INTEGER NOT NULL,
+                prefix INTEGER NOT NULL,
+                feature INTEGER NOT NULL,
+                repeat_num INTEGER NOT NULL DEFAULT 0,
+                canvas_hash TEXT NOT NULL,
+                canvas sub INTEGER NOT NULL,
+                sub_idx INTEGER NOT NULL,
+                len INTEGER NOT NULL,
+                PRIMARY KEY (channel, prefix, feature, repeat_num)
+            );
+            """
+        )
+    )
+    cursor.execute(
+        dedent(
+            """
+            CREATE TABLE IF NOT EXISTS wide_frequency (
+                channel INTEGER NOT NULL,
+                prefix INTEGER NOT NULL,
+                feature INTEGER NOT NULL,
+                canvasses INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (channel, prefix, feature)
+            );
+            """
+        )
+    )
+
+    # running totals, so that nobody has to count the prints table
+    cursor.execute(
+        dedent(
+            """
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+    )
+    conn.commit()
+
+
 def make_or_get():
     """
     If the user doesn't have a .gnize dir in their home directory, initialize it
@@ -125,40 +208,15 @@ def make_or_get():
         print("wrote {config_path}", file=sys.stderr)
         config = load(config_str, Loader=BaseLoader)
 
+    # these are counted as they're stored, `gn --reindex` recounts them
+    from gnize.store import stored_canvasses, stored_prints
+
     # canvasses
-    if config.canvasses.use == "filesystem":
-        canvas_dir = Path(config.canvasses.path)
-        canvas_dir.mkdir(parents=True, exist_ok=True)
-        count = 0
-        for child in canvas_dir.glob("*"):
-            if multihash.is_valid(str(child)):
-                count += 1
-        print(f"{count} canvasses found in f{canvas_dir}", file=sys.stderr)
-
-    # fingerprints database
-    if config.fingerprints.use == "sqlite3":
-        conn = sqlite3.connect(config.fingerprints.connect)
-        cursor = conn.cursor()
-        cursor.execute(
-            dedent(
-                """
-                CREATE TABLE IF NOT EXISTS prints (
-                    channel INTEGER NOT NULL,
-                    fingerprint INTEGER NOT NULL,
-                    repeat_num INTEGER NOT NULL DEFAULT 0,
-                    canvas_hash TEXT NOT NULL,
-                    canvas sub INTEGER NOT NULL,
-                    sub_idx INTEGER NOT NULL,
-                    len INTEGER NOT NULL,
-                    PRIMARY KEY (channel, fingerprint, repeat_num)
-                );
-                """
-            )
-        )
-        cursor.execute("SELECT count(*) from prints;")
-        count = cursor.fetchone()[0]
-        cursor.execute("SELECT count(distinct canvas_hash) from prints;")
-        count = cursor.fetchone()[0]
-        print(f"{count} fingerprints cognized so far", file=sys.stderr)
+    count = stored_canvasses(config)
+    print(f"{count} canvasses found in {config.canvasses.path}", file=sys.stderr)
+
+    # fingerprints
+    count = stored_prints(config)
+    print(f"{count} fingerprints cognized so far", file=sys.stderr)
 
     return config
@@ -107,33 +107,104 @@ fingerprint of "¢‽" in channel 964
     '0xcb3'
 """
 
+import os
 import sys
 import select
 import json
 import argparse
 import math
 import logging
+import struct
 import timeit
-from multiprocessing import Manager, Queue, Process
-from copy import deepcopy
-from pyfinite import ffield
-from gnize import galois
+import zlib
+from dataclasses import FrozenInstanceError
+from multiprocessing import Pool
+from concurrent.futures import ProcessPoolExecutor
+from gnize import cache, galois, karprabin
+from gnize.suffixes import repeats
+from gnize.galois import gf2_mod, gf2_mulmod
 from sortedcontainers import SortedDict
-from collections import namedtuple
+from collections import deque, namedtuple
 from textwrap import indent
-
-field = ffield.FField(15)
+from functools import lru_cache, partial
+from typing import AsyncIterator, Iterable, Iterator, List, Optional
 
 Result = namedtuple("Result", "fingerprints stats")
+Print = namedtuple("Print", "channel prefix feature begin end")
+
+# everything about a channel that digestion needs, worked out once
+# karp-rabin channels have a base instead of a polynomial, their "degree"
+# is just the width of their fingerprints, less one
+Channel = namedtuple("Channel", "number base polynomial degree table doublings")
+
+
+@lru_cache(maxsize=None)
+def reduction_table(polynomial: int):
+    """
+    Shifting the buffer left by 16 overflows its top bits past the
+    channel's degree.  This table maps those top bits to their remainder,
+    so a digestion is a lookup and a few xors rather than a long division.
+
+    The table is linear (the remainder of a ^ b is the remainder of a
+    xored with that of b), so each entry is one xor away from an entry
+    that has already been calculated.
+    """
+
+    degree = galois.degree(polynomial)
+    shift = max(0, degree - 16)
+    bits = min(degree, 16)
+
+    table = [0] * (1 << bits)
+    for i in range(bits):
+        table[1 << i] = gf2_mod(1 << (i + 16 + shift), polynomial)
+    for t in range(3, 1 << bits):
+        low = t & -t
+        if t != low:
+            table[t] = table[t ^ low] ^ table[low]
+    return table
+
+
+@lru_cache(maxsize=None)
+def doublings(polynomial: int):
+    "x^(16 * 2^i) mod polynomial, for each i up to 64"
+
+    powers = [gf2_mod(1 << 16, polynomial)]
+    for _ in range(63):
+        powers.append(gf2_mulmod(powers[-1], powers[-1], polynomial))
+    return tuple(powers)
+
+
+@lru_cache(maxsize=None)
+def compile_channel(number: int) -> Channel:
+    "built once per channel, per process"
+
+    if number in karprabin.channel:
+        return Channel(
+            number, karprabin.channel[number], None, karprabin.bits - 1, None, None
+        )
+
+    polynomial = galois.channels[number]
+    return Channel(
+        number,
+        None,
+        polynomial,
+        galois.degree(polynomial),
+        tuple(reduction_table(polynomial)),
+        doublings(polynomial),
+    )
 
 
 class Params:
+    """
+    Settings for all_subs.  Params are immutable (use replace to get a
+    changed copy) so that they can be shared between passes and processes.
+    """
 
     defaults = {
         "channel": 963,
         "max_prefix_len": 15,
         "retry_percent": 0.01,
-        "prefix_thresholds": [0x002F, 0x004F, 0x008F],
+        "prefix_thresholds": (0x002F, 0x004F, 0x008F),
         "prefix_threshold": 0x002F,
         "skip_prefix": False,
         "feature_threshold": 0x00FF,
@@ -141,17 +212,105 @@ class Params:
         "parallel": True,
         "batch_size_divisor": 100,
         "batch_increase_divisor": 1000,
+        "reuse_repeats": True,
+        "selection": "ladder",
+        "target_density": 10,
+        "features_per_prefix": 1,
+        "kgram_len": 32,
+        "winnow_window": 64,
+        "cache": None,
+        "cache_capacity": cache.default_capacity,
     }
 
+    # these change how the work is done, not what is found
+    neutral = [
+        "parallel",
+        "batch_size_divisor",
+        "batch_increase_divisor",
+        "reuse_repeats",
+        "cache",
+        "cache_capacity",
+    ]
+
+    resolved = [
+        "channel_base",
+        "channel_polynomial",
+        "channel_degree",
+        "channel_table",
+        "channel_doublings",
+    ]
+
+    __slots__ = list(defaults) + resolved
+
     def __init__(self, **kwargs):
 
+        unknown = set(kwargs) - set(Params.defaults)
+        if unknown:
+            raise TypeError(f"unknown params: {', '.join(sorted(unknown))}")
+
         # apply defaults, then override with user args
-        self.__dict__.update(Params.defaults)
-        self.__dict__.update(kwargs)
+        values = dict(Params.defaults, **kwargs)
+        values["prefix_thresholds"] = tuple(values["prefix_thresholds"])
 
         # resolve channel number
-        self.channel_polynomial = galois.channel[self.channel]
-        self.channel_degree = math.floor(math.log(self.channel_polynomial, 2))
+        channel = compile_channel(values["channel"])
+        values["channel_base"] = channel.base
+        values["channel_polynomial"] = channel.polynomial
+        values["channel_degree"] = channel.degree
+        values["channel_table"] = channel.table
+        values["channel_doublings"] = channel.doublings
+
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise FrozenInstanceError(f"cannot assign to Params.{name}, use replace")
+
+    def __delattr__(self, name):
+        raise FrozenInstanceError(f"cannot delete Params.{name}")
+
+    def values(self) -> dict:
+        return {name: getattr(self, name) for name in Params.defaults}
+
+    def replace(self, **changes):
+        "a copy, with changes"
+        return Params(**dict(self.values(), **changes))
+
+    # pickle (and deepcopy) by value, the channel tables are rebuilt from
+    # the process-wide cache on the other side rather than shipped
+    def __reduce__(self):
+        return (partial(Params, **self.values()), ())
+
+    def __eq__(self, other):
+        return isinstance(other, Params) and self.values() == other.values()
+
+    def __hash__(self):
+        return hash(tuple(self.values().items()))
+
+    def __repr__(self):
+        changed = ", ".join(
+            f"{name}={value!r}"
+            for name, value in self.values().items()
+            if value != Params.defaults[name]
+        )
+        return f"Params({changed})"
+
+    @property
+    def horizon(self) -> int:
+        """
+        How much of its target from_start reads, targets that agree this
+        far get the same fingerprints (it reads one character past the
+        longest feature before giving up)
+        """
+        return max(self.max_prefix_len, self.max_feature_len) + 2
+
+    def settings(self) -> dict:
+        "the parameters that determine which fingerprints are found"
+        return {
+            name: getattr(self, name)
+            for name in Params.defaults
+            if name not in Params.neutral
+        }
 
 
 class Stats:
@@ -168,12 +327,22 @@ class Stats:
         "processes_used",
         "start_batch_size",
         "batch_size_increase",
+        "repeated_offsets",
+        "cache_hits",
     ]
 
+    # not counted, but reported: the thresholds that the scan settled on
+    chosen = ["prefix_threshold", "feature_threshold"]
+
+    # how they're kept with a cached result, -1 for None
+    chosen_record = struct.Struct("<qq")
+
     def __init__(self):
         for counter in Stats.counters:
             setattr(self, counter, 0)
             self.start = timeit.default_timer()
+        for setting in Stats.chosen:
+            setattr(self, setting, None)
 
     def finalize(self):
         self.time = timeit.default_timer() - self.start
@@ -184,6 +353,14 @@ class Stats:
             addition = getattr(other, counter)
             setattr(self, counter, old_value + addition)
 
+    def chosen_to_bytes(self) -> bytes:
+        values = [getattr(self, setting) for setting in Stats.chosen]
+        return Stats.chosen_record.pack(*[-1 if v is None else v for v in values])
+
+    def chosen_from_bytes(self, data: bytes):
+        for setting, value in zip(Stats.chosen, Stats.chosen_record.unpack(data)):
+            setattr(self, setting, None if value < 0 else value)
+
     def __repr__(self):
         return "[" + self.__str__().replace("\n", "|") + "]"
 
@@ -191,6 +368,9 @@ class Stats:
         lines = []
         for counter in Stats.counters:
             lines.append(f"{counter} = {getattr(self, counter)}")
+        for setting in Stats.chosen:
+            value = getattr(self, setting)
+            lines.append(f"{setting} = {value if value is None else hex(value)}")
         lines.append(f"time = {self.time}")
         return "\n".join(lines)
 
@@ -200,6 +380,9 @@ class Fingerprints:
     A container for collecting fingerprints
     """
 
+    # channel, begin, end, prefix, feature
+    record = struct.Struct("<IIIQQ")
+
     def __init__(self):
         self.dict = SortedDict()
 
@@ -227,6 +410,17 @@ class Fingerprints:
             for coords, substring in d.items():
                 self.dict.setdefault(score, {})[coords] = substring
 
+    def shifted(self, distance):
+        "the same fingerprints, found distance characters further along"
+
+        moved = Fingerprints()
+        for score, d in self.dict.items():
+            moved.dict[score] = {
+                ((begin + distance, end + distance), subprints): substring
+                for ((begin, end), subprints), substring in d.items()
+            }
+        return moved
+
     def __str__(self):
 
         string = ""
@@ -250,6 +444,40 @@ class Fingerprints:
 
         return json.dumps(out, sort_keys=True, indent=2)
 
+    def prints(self):
+        """
+        Yield a Print for each fingerprint, ordered by appearance
+        """
+
+        found = []
+        for d in self.dict.values():
+            for (begin, end), subprints in d.keys():
+                channel, prefix, feature = parse_subprints(subprints)
+                found.append(Print(channel, prefix, feature, begin, end))
+        return iter(sorted(found, key=lambda p: (p.begin, p.end)))
+
+    def to_bytes(self) -> bytes:
+        "a compact form, without substrings (see set_substrings)"
+
+        records = bytearray()
+        for d in self.dict.values():
+            for (begin, end), subprints in d.keys():
+                channel, prefix, feature = parse_subprints(subprints)
+                records += Fingerprints.record.pack(
+                    channel, begin, end, prefix, feature
+                )
+        return zlib.compress(bytes(records))
+
+    @staticmethod
+    def from_bytes(data: bytes):
+
+        fingerprints = Fingerprints()
+        for channel, begin, end, prefix, feature in Fingerprints.record.iter_unpack(
+            zlib.decompress(data)
+        ):
+            fingerprints.add(channel, prefix, feature, (begin, end))
+        return fingerprints
+
     def set_substrings(self, text):
 
         for score, d in self.dict.items():
@@ -259,6 +487,28 @@ class Fingerprints:
                 self.dict[score][coords] = text[start:end]
 
 
+def parse_subprints(subprints: str):
+    """
+    Inverse of the formatting in Fingerprints.add:
+    '[963:002f->00a1]' -> (963, 0x002f, 0x00a1)
+    """
+
+    channel, prints = subprints.strip("[]").split(":")
+    prefix, feature = prints.split("->")
+    return int(channel), int(prefix, 16), int(feature, 16)
+
+
+def worker_init(target: str, params: Params):
+    """
+    Runs once in each pool process, so that batches can be sent as just
+    offsets and a threshold
+    """
+
+    global worker_target, worker_params
+    worker_target = target
+    worker_params = params
+
+
 def batch_worker(batch):
     """
     Called by the multiprocessing module, does a portion of the work
@@ -267,185 +517,461 @@ def batch_worker(batch):
 
     start = timeit.default_timer()
 
-    return_queue, tasks, params, batch_num = batch
-
-    op_count = sum(map(len, [task[1] for task in tasks]))
-    logging.debug(f"Batch: {batch_num} Size:{op_count}")
-
-    _fingerprints = Fingerprints()
-    _stats = Stats()
+    tasks, prefix_threshold, batch_num = batch
+    params = worker_params.replace(prefix_threshold=prefix_threshold)
 
-    for offset, target_substr in tasks:
-        result = from_start(offset, target_substr, params)
-        _fingerprints.merge(result.fingerprints)
-        _stats.update(result.stats)
+    logging.debug(f"Batch: {batch_num} Size:{len(tasks)}")
 
-    return_queue.put(Result(_fingerprints, _stats))
+    result = scan_offsets(worker_target, tasks, params)
 
     stop = timeit.default_timer()
 
     logging.debug("Batch: {}, Finished In: {}".format(batch_num, stop - start))
 
+    return result
+
+
+def scan_offsets(target: str, tasks, params: Params) -> Result:
+    "from_offsets for each (offset, copies) in tasks"
+
+    fingerprints = Fingerprints()
+    stats = Stats()
+
+    # from_start reads no further than the horizon, so don't copy the rest
+    for offset, copies in tasks:
+        task = target[offset : offset + params.horizon]
+        from_offsets(offset, task, copies, params, fingerprints, stats)
+
+    return Result(fingerprints, stats)
+
 
 def all_subs(target: str, params=Params()) -> dict:
     """
     Scan all substrings of the target for fingerprints, return only the
     interesting ones (where interesting is determined by params.*_threshold)
+
+    If params.cache names a directory, look there for the result before
+    scanning, and leave it there afterwards (see cache.py)
     """
 
+    if not params.cache:
+        return scan(target, params)
+
+    # an entry is the chosen thresholds (see Stats), then the fingerprints
+    name = cache.key(target, params.settings())
+    cached = cache.load(params.cache, name)
+    if cached is not None:
+        header = Stats.chosen_record.size
+        fingerprints = Fingerprints.from_bytes(cached[header:])
+        fingerprints.set_substrings(target)
+        stats = Stats()
+        stats.chosen_from_bytes(cached[:header])
+        stats.cache_hits = 1
+        return Result(fingerprints, stats)
+
+    result = scan(target, params)
+    entry = result.stats.chosen_to_bytes() + result.fingerprints.to_bytes()
+    cache.save(params.cache, name, entry, params.cache_capacity)
+    return result
+
+
+def scan(target: str, params: Params) -> Result:
+    "all_subs, without the cache"
+
+    if params.selection == "quantile":
+        return quantile_scan(target, params)
+    if params.selection == "winnow":
+        return winnow_scan(target, params)
+    if params.selection != "ladder":
+        raise ValueError(f"unknown selection: {params.selection}")
+
     fingerprints = Fingerprints()
     stats = Stats()
 
-    # try a sparse scan first
-    # accept weaker prefixes if nothing is found
-    for attempt in params.prefix_thresholds:
-
-        current_params = deepcopy(params)
-        current_params.prefix_threshold = attempt
-        stats.passes += 1
-
-        offset_front_anchored_substrings = []
-        # suppose target="abcdefghijklmnopqrstuvwxyz", then this loop creates:
-        # abcdefghijklmnopqrstuvwxyz
-        # bcdefghijklmnopqrstuvwxyz
-        # cdefghijklmnopqrstuvwxyz
-        # ...
-        # xyz
-        # yz
-        # z
-        for i in range(len(target)):
-            offset_front_anchored_substrings.insert(0, (i, target[i:]))
-
-        # this seems like a problem that would benefit from parallelism
-        # but I can't get parallel to go faster than serial
-        # why?
-
-        if not current_params.parallel:
-
-            # single threaded
-            for offset, task in offset_front_anchored_substrings:
-                result = from_start(offset, task, current_params)
+    # text that repeats only needs to be scanned once, see suffixes.py
+    copies = repeats(target, params.horizon) if params.reuse_repeats else {}
+    duplicates = {offset for others in copies.values() for offset in others}
+
+    # workers are started on the first parallel pass, and kept for the rest
+    pool = None
+
+    try:
+        # try a sparse scan first
+        # accept weaker prefixes if nothing is found
+        for attempt in params.prefix_thresholds:
+
+            current_params = params.replace(prefix_threshold=attempt)
+            stats.passes += 1
+
+            offset_front_anchored_substrings = []
+            # suppose target="abcdefghijklmnopqrstuvwxyz", then this loop
+            # scans substrings starting at each offset:
+            # abcdefghijklmnopqrstuvwxyz
+            # bcdefghijklmnopqrstuvwxyz
+            # cdefghijklmnopqrstuvwxyz
+            # ...
+            # xyz
+            # yz
+            # z
+            for i in range(len(target)):
+                if i not in duplicates:
+                    offset_front_anchored_substrings.insert(0, (i, copies.get(i, [])))
+
+            # this seems like a problem that would benefit from parallelism
+            # but I can't get parallel to go faster than serial
+            # why?
+
+            if not current_params.parallel:
+
+                # single threaded
+                result = scan_offsets(
+                    target, offset_front_anchored_substrings, current_params
+                )
                 fingerprints.merge(result.fingerprints)
                 stats.update(result.stats)
 
-            stats.threads_used = 1
+                stats.threads_used = 1
 
-        else:
+            else:
 
-            logging.basicConfig(
-                level=logging.DEBUG,
-                format="%(relativeCreated)6d %(threadName)s %(message)s",
-            )
+                prepared_batches = []
+                batch_num = 0
 
-            processes = []
-            prepared_batches = []
-            batch_num = 0
-            return_queue = Queue()
+                # the first chunks of work ar the heaviest, so carve off
+                # larger chunks later
+                batch_size = max(
+                    5, math.ceil(len(target) / current_params.batch_size_divisor)
+                )
+                batch_size_increase = max(
+                    1, math.ceil(len(target) / current_params.batch_increase_divisor)
+                )
 
-            # the first chunks of work ar the heaviest, so carve off
-            # larger chunks later
-            batch_size = max(
-                5, math.ceil(len(target) / current_params.batch_size_divisor)
-            )
-            batch_size_increase = max(
-                1, math.ceil(len(target) / current_params.batch_increase_divisor)
-            )
+                stats.start_batch_size = batch_size
+                stats.batch_size_increase = batch_size_increase
 
-            stats.start_batch_size = batch_size
-            stats.batch_size_increase = batch_size_increase
+                # assign the work to batches
+                while offset_front_anchored_substrings:
 
-            # assign the work to batches
-            while offset_front_anchored_substrings:
+                    # as tasks get smaller, allocate more of them to a thread
+                    work = []
+                    for _ in range(batch_size):
+                        try:
+                            work.append(offset_front_anchored_substrings.pop())
+                            work.append(offset_front_anchored_substrings.pop())
+                        except IndexError:
+                            pass
 
-                # as tasks get smaller, allocate more of them to a thread
-                work = []
-                for _ in range(batch_size):
-                    try:
-                        work.append(offset_front_anchored_substrings.pop())
-                        work.append(offset_front_anchored_substrings.pop())
-                    except IndexError:
-                        pass
+                    batch_size += batch_size_increase
 
-                batch_size += batch_size_increase
+                    prepared_batches.append((work, attempt, batch_num))
+                    batch_num += 1
 
-                prepared_batches.append((return_queue, work, current_params, batch_num))
-                batch_num += 1
+                # the target and params go to each worker once, not per batch
+                if pool is None:
+                    pool = Pool(initializer=worker_init, initargs=(target, params))
 
-            # start processing batches
-            for batch in prepared_batches:
-                p = Process(target=batch_worker, args=(batch,))
-                processes.append(p)
-                p.start()
+                # aggregate results
+                for result in pool.imap_unordered(batch_worker, prepared_batches):
+                    fingerprints.merge(result.fingerprints)
+                    stats.update(result.stats)
 
-            # aggregate results
-            for result in [return_queue.get() for p in processes]:
-                fingerprints.merge(result.fingerprints)
-                stats.update(result.stats)
+            fingerprints.set_substrings(target)
 
-            # clean up processes
-            # for process in processes:
-            # p.join()
+            stats.prefix_threshold = attempt
+            stats.feature_threshold = params.feature_threshold
 
-        fingerprints.set_substrings(target)
+            # return if enough fingerprints were found
+            if len(fingerprints.dict) > (current_params.retry_percent * len(target)):
+                return Result(fingerprints, stats)
 
-        # return if enough fingerprints were found
-        if len(fingerprints.dict) > (current_params.retry_percent * len(target)):
-            return Result(fingerprints, stats)
+        # all scans exhausted, return what we foun
+        return Result(fingerprints, stats)
 
-    # all scans exhausted, return what we foun
-    return Result(fingerprints, stats)
+    finally:
+        if pool is not None:
+            pool.close()
 
 
-def from_start(offset: int, target: str, params: Params) -> Result:
+def quantile_scan(target: str, params: Params) -> Result:
     """
-    Return a dictionary mapping from scores to found fingerprints
-    Only substrings beginning at the first character are considered:
+    Rather than rescanning with weaker and weaker prefix thresholds until
+    enough fingerprints turn up, look at the fingerprints once and pick
+    the thresholds that yield params.target_density fingerprints per 1000
+    characters.
 
-    if target is 'tuvwxyz'
-    fingerprints:
-    t, tu, tuv, tuvw, tuvwx, tuvwxy, tuvwxyz
+    First, the best prefix at every offset (this is as much work as one
+    fruitless ladder pass).  Enough of the best are kept that each would
+    need params.features_per_prefix features, and the features that follow
+    them are gathered.  The best of those become fingerprints.
+
+    The thresholds are rounded to the 16 bit units that Params uses and are
+    reported in the stats.  They depend on the text, so a recognizer should
+    scan its noise with the cognizer's thresholds, e.g.:
+
+        Params(prefix_thresholds=(stats.prefix_threshold,),
+               feature_threshold=stats.feature_threshold)
+
+    which finds exactly the fingerprints found here.
     """
 
     fingerprints = Fingerprints()
     stats = Stats()
-    buffer = 0
-    buffer_degree = 63
+    stats.passes = 1
 
-    # digest in two-byte chunks
-    # buf(n) = mod(cat(buf(n-1),newdata), channelpolynomial)
-    # This yields the rabin fingerprint of the bits digested so far (I think)
-    def digest(d: bytes, buffer):
+    scale = params.channel_degree - 15
+    step = digester(params)
+    window = params.max_prefix_len + 1
+    wanted = max(1, math.ceil(params.target_density * len(target) / 1000))
 
-        data = int.from_bytes(d, byteorder="big")
+    # the best prefix at each offset that from_start would consider
+    prefixes = []
+    if params.skip_prefix:
+        prefixes = [(0, offset) for offset in range(len(target))]
+    else:
+        first = first_prefix(params)
+        for offset in range(len(target) - params.max_prefix_len):
+            buffer = 0
+            best = None
+            for i, c in enumerate(target[offset : offset + window]):
+                buffer = step(c, buffer)
+                if i >= first and (best is None or buffer < best):
+                    best = buffer
+            prefixes.append((best, offset))
+    prefixes.sort()
+
+    kept = min(len(prefixes), math.ceil(wanted / params.features_per_prefix))
+    if not kept:
+        return Result(fingerprints, stats)
+    prefix_threshold = (prefixes[kept - 1][0] >> scale) + 1
+
+    # every feature that follows a prefix under that threshold
+    candidates = []
+    start = 0 if params.skip_prefix else window
+    for prefix, offset in prefixes:
+        if prefix >= prefix_threshold << scale:
+            break
+        stats.fruitful_prefix_searches += 1
+
+        buffer = 0
+        for i, c in enumerate(target[offset : offset + params.max_feature_len + 1]):
+            buffer = step(c, buffer)
+            if i >= start:
+                candidates.append((buffer, offset, offset + i + 1, prefix))
+
+    stats.fruitless_prefix_searches = len(prefixes) - stats.fruitful_prefix_searches
+    stats.prefix_threshold = prefix_threshold
+    if not candidates:
+        return Result(fingerprints, stats)
+
+    candidates.sort()
+    feature_threshold = (candidates[min(wanted, len(candidates)) - 1][0] >> scale) + 1
+    stats.feature_threshold = feature_threshold
+
+    for feature, begin, end, prefix in candidates:
+        if feature >= feature_threshold << scale:
+            break
+        fingerprints.add(params.channel, prefix, feature, (begin, end))
+        stats.features_found += 1
+
+    fingerprints.set_substrings(target)
+    return Result(fingerprints, stats)
 
-        buffer <<= 16
-        buffer ^= data
-        _, fingerprint = field.FullDivision(
-            buffer, params.channel_polynomial, buffer_degree, params.channel_degree
-        )
-        buffer = fingerprint
-        return buffer
 
-    # digest character-at-a-time
-    # some unicode characters may require two digestions
-    # others might involve superfluous zeros
-    def digest_char(c: str, buffer):
+def winnow_scan(target: str, params: Params) -> Result:
+    """
+    Winnowing: of the substrings that are params.kgram_len characters long,
+    select the one with the smallest fingerprint in every run of
+    params.winnow_window of them (the rightmost, if there's a tie).
+
+    Unlike the threshold scans, this can't come up empty: any stretch of
+    kgram_len + winnow_window - 1 characters has a fingerprint in it, and
+    text that's too short for a whole window (but not shorter than a
+    substring) gets its smallest one.  The
+    fingerprints are calculated by rolling (see the algebra below), and the
+    window minimums are kept in a deque whose fingerprints only increase,
+    so the whole scan is one pass.
+
+    The selected fingerprints are stored like any other: the feature is
+    the fingerprint of the whole substring, and its prefix is the
+    fingerprint of its first max_prefix_len + 1 characters.  Since only the
+    substring decides what those are, a cognizer and a recognizer that both
+    winnow with the same channel, kgram_len and winnow_window will agree.
+    """
+
+    if params.kgram_len <= params.max_prefix_len:
+        raise ValueError("kgram_len must be longer than max_prefix_len")
+
+    fingerprints = Fingerprints()
+    stats = Stats()
+    stats.passes = 1
+
+    k = params.kgram_len
+    prefixes = list(rolling(target, params.max_prefix_len + 1, params))
+    features = list(rolling(target, k, params))
+    window = min(params.winnow_window, len(features))
+
+    smallest = deque()
+    selected = None
+    for i, feature in enumerate(features):
+
+        # nothing bigger than the newcomer can be the minimum again
+        while smallest and features[smallest[-1]] >= feature:
+            smallest.pop()
+        smallest.append(i)
+        if smallest[0] <= i - window:
+            smallest.popleft()
+
+        if i >= window - 1 and smallest[0] != selected:
+            selected = smallest[0]
+            fingerprints.add(
+                params.channel,
+                prefixes[selected],
+                features[selected],
+                (selected, selected + k),
+            )
+            stats.features_found += 1
+
+    fingerprints.set_substrings(target)
+    return Result(fingerprints, stats)
+
+
+# digest in two-byte chunks
+# buf(n) = mod(cat(buf(n-1),newdata), channelpolynomial)
+# This yields the rabin fingerprint of the bits digested so far (I think)
+def digest(d: bytes, buffer, params: Params):
+
+    data = int.from_bytes(d, byteorder="big")
+
+    # buffer has fewer bits than the polynomial, so everything stays within
+    # 64 bits: split it at 16 below the degree, the high part overflows when
+    # shifted, so look up its remainder, the low part just moves up
+    degree = params.channel_degree
+    shift = max(0, degree - 16)
+    table = params.channel_table
+    buffer = table[buffer >> shift] ^ ((buffer & ((1 << shift) - 1)) << 16) ^ data
+
+    # for degree 15 channels, the data itself can reach the degree
+    if buffer >> degree:
+        buffer ^= params.channel_polynomial
+    return buffer
+
+
+# digest character-at-a-time
+# some unicode characters may require two digestions
+# others might involve superfluous zeros
+def digest_char(c: str, buffer, params: Params):
+
+    cbytes = c.encode("utf-8")
+    if len(cbytes) <= 2:
+        buffer = digest(cbytes, buffer, params)
+    else:
+        buffer = digest(cbytes[0:2], buffer, params)
+        buffer = digest(cbytes[2:], buffer, params)
+
+    return buffer
 
-        cbytes = c.encode("utf-8")
-        if len(cbytes) <= 2:
-            buffer = digest(cbytes, buffer)
-        else:
-            buffer = digest(cbytes[0:2], buffer)
-            buffer = digest(cbytes[2:], buffer)
 
-        return buffer
+def chunks(c: str) -> int:
+    "how many two-byte digestions a character takes"
+    return 1 if len(c.encode("utf-8")) <= 2 else 2
+
+
+def digester(params: Params):
+    "digest_char for this channel's family, as a function of (c, buffer)"
+
+    if params.channel_base is not None:
+        base = params.channel_base
+        return lambda c, buffer: karprabin.digest_char(c, buffer, base)
+    return lambda c, buffer: digest_char(c, buffer, params)
+
+
+def first_prefix(params: Params) -> int:
+    """
+    The index of the first character whose prefix may be chosen
+
+    A galois buffer takes one character (two bytes) per step, so until it
+    has taken enough of them to fill the channel's width it holds only the
+    characters, unmixed, and is small however unlikely the text.  Only once
+    the first character has been shifted up into the top 16 bits does the
+    buffer compare to a scaled threshold the way a degree 15 buffer does
+    from the start.  Karp-Rabin channels multiply every character through,
+    so they are mixed from the first.  (A prefix window that's too short to
+    fill the buffer gets its last character.)
+    """
+
+    if params.channel_base is not None:
+        return 0
+    return min((params.channel_degree + 1) // 16 - 1, params.max_prefix_len)
+
+
+def fingerprint_bits(channel: int) -> int:
+    "how wide a fingerprint from this channel can be"
+
+    if channel in karprabin.channel:
+        return karprabin.bits
+    return galois.degree(galois.channels[channel]) + 1
+
+
+def from_offsets(
+    offset: int, target: str, copies, params: Params, fingerprints=None, stats=None
+) -> Result:
+    """
+    from_start, with its result copied to each of the other offsets in
+    copies (whose text must agree with target out to params.horizon)
+    """
+
+    fingerprints = Fingerprints() if fingerprints is None else fingerprints
+    stats = Stats() if stats is None else stats
+    if not copies:
+        return from_start(offset, target, params, fingerprints, stats)
+
+    result = from_start(offset, target, params)
+
+    fingerprints.merge(result.fingerprints)
+    for other in copies:
+        fingerprints.merge(result.fingerprints.shifted(other - offset))
+
+    # count the copies as if they had been scanned, plus a note that they weren't
+    for _ in range(len(copies) + 1):
+        stats.update(result.stats)
+    stats.repeated_offsets += len(copies)
+
+    return Result(fingerprints, stats)
+
+
+def from_start(
+    offset: int, target: str, params: Params, fingerprints=None, stats=None
+) -> Result:
+    """
+    Return a dictionary mapping from scores to found fingerprints
+    Only substrings beginning at the first character are considered:
+
+    if target is 'tuvwxyz'
+    fingerprints:
+    t, tu, tuv, tuvw, tuvwx, tuvwxy, tuvwxyz
+
+    If fingerprints and stats are given, they are added to (rather than
+    making new ones for every offset)
+    """
+
+    fingerprints = Fingerprints() if fingerprints is None else fingerprints
+    stats = Stats() if stats is None else stats
+    buffer = 0
 
     # Prefixes are more plentiful than features. This lets recognizers
     # do a shallow first pass quickly and only do a deep second pass one
     # the substrings found by the first pass
 
+    # thresholds are written for 16 bit fingerprints, wider channels
+    # need them scaled up to the top 16 bits, and (see first_prefix) the
+    # buffer filled out to the channel's width before it's compared
+    scale = params.channel_degree - 15
+    prefix_threshold = params.prefix_threshold << scale
+    feature_threshold = params.feature_threshold << scale
+    first = first_prefix(params)
+
     # start high, find the lowest as we go
-    prefix_candidate_fingerprint = 0xFFFF
+    prefix_candidate_fingerprint = (0xFFFF << scale) | ((1 << scale) - 1)
     prefix_fingerprint = None
     feature_found = False
 
@@ -453,21 +979,22 @@ def from_start(offset: int, target: str, params: Params) -> Result:
         prefix_fingerprint = 0
 
     # for each character
+    step = digester(params)
     for i, c in enumerate(target):
 
-        buffer = digest_char(c, buffer)
+        buffer = step(c, buffer)
 
         if prefix_fingerprint is None:
 
             # update prefix candiate if updated fingerprint beats it
-            if buffer < prefix_candidate_fingerprint:
+            if i >= first and buffer < prefix_candidate_fingerprint:
                 prefix_candidate_fingerprint = buffer
 
             # at the end of the prefix window
             if i == params.max_prefix_len:
 
                 # did we find an interesting prefix?
-                if prefix_candidate_fingerprint < params.prefix_threshold:
+                if prefix_candidate_fingerprint < prefix_threshold:
 
                     # save the best prefix so far
                     prefix_fingerprint = prefix_candidate_fingerprint
@@ -488,7 +1015,7 @@ def from_start(offset: int, target: str, params: Params) -> Result:
                 break
 
             # only register "interesting" features
-            if buffer < params.feature_threshold:
+            if buffer < feature_threshold:
 
                 fingerprints.add(
                     params.channel, prefix_fingerprint, buffer, (offset, offset + i + 1)
@@ -503,6 +1030,304 @@ def from_start(offset: int, target: str, params: Params) -> Result:
     return Result(fingerprints, stats)
 
 
+# Fingerprint algebra
+#
+# Digesting a chunk multiplies the buffer by x^16 and adds the chunk, so
+# the fingerprint of a string with chunks d_1 ... d_k is:
+#
+#   fp = d_1 x^(16(k-1)) + d_2 x^(16(k-2)) + ... + d_k   (mod channel)
+#
+# and for two strings A and B, where B is k chunks long:
+#
+#   fp(A + B) = fp(A) * x^(16k) + fp(B)                   (mod channel)
+#
+# So if we keep the fingerprint and chunk count of each fragment of a
+# signal (its subcanvasses, say), the fingerprint of any concatenation of
+# them can be found without digesting any text.
+#
+# Karp-Rabin channels work the same way, with a chunk per character and
+# base^k mod 2^61 - 1 in place of x^(16k).
+
+Fragment = namedtuple("Fragment", "fingerprint chunks")
+
+
+@lru_cache(maxsize=4096)
+def shift(chunks: int, polynomial: int) -> int:
+    "x^(16 * chunks) mod polynomial"
+
+    power = 1
+    for i, doubled in enumerate(doublings(polynomial)):
+        if chunks >> i & 1:
+            power = gf2_mulmod(power, doubled, polynomial)
+    return power
+
+
+def fragment(text: str, params: Params) -> Fragment:
+    "digest text the same way that from_start does"
+
+    step = digester(params)
+    buffer = 0
+    for c in text:
+        buffer = step(c, buffer)
+
+    if params.channel_base is not None:
+        return Fragment(buffer, len(text))
+    return Fragment(buffer, sum(map(chunks, text)))
+
+
+def concat(a: Fragment, b: Fragment, params: Params) -> Fragment:
+    "the fragment for the text of a followed by the text of b"
+
+    if params.channel_base is not None:
+        base = params.channel_base
+        shifted = a.fingerprint * karprabin.shift(b.chunks, base)
+        return Fragment(
+            (shifted + b.fingerprint) % karprabin.modulus, a.chunks + b.chunks
+        )
+
+    polynomial = params.channel_polynomial
+    shifted = gf2_mulmod(a.fingerprint, shift(b.chunks, polynomial), polynomial)
+    return Fragment(shifted ^ b.fingerprint, a.chunks + b.chunks)
+
+
+def drop(whole: Fragment, head: Fragment, params: Params) -> Fragment:
+    "the fragment for the text of whole, less the text of head at its front"
+
+    rest = whole.chunks - head.chunks
+    if params.channel_base is not None:
+        shifted = head.fingerprint * karprabin.shift(rest, params.channel_base)
+        return Fragment((whole.fingerprint - shifted) % karprabin.modulus, rest)
+
+    polynomial = params.channel_polynomial
+    shifted = gf2_mulmod(head.fingerprint, shift(rest, polynomial), polynomial)
+    return Fragment(whole.fingerprint ^ shifted, rest)
+
+
+def rolling(text: str, length: int, params: Params):
+    """
+    Yield the fingerprint of each substring of text that is length
+    characters long, in order.  Each is one digestion and one drop away
+    from the last, rather than length digestions.
+    """
+
+    step = digester(params)
+    characters = {}
+    window = Fragment(0, 0)
+
+    for i, c in enumerate(text):
+        if c not in characters:
+            characters[c] = fragment(c, params)
+        window = Fragment(
+            step(c, window.fingerprint), window.chunks + characters[c].chunks
+        )
+
+        if i >= length:
+            window = drop(window, characters[text[i - length]], params)
+        if i >= length - 1:
+            yield window.fingerprint
+
+
+class Signal:
+    """
+    The fingerprint of a signal, kept as one fragment per subcanvas, so
+    that replacing, adding, or removing a subcanvas (as happens when the
+    user edits the gaps between them) only digests the subcanvas that
+    changed
+    """
+
+    def __init__(self, subcanvasses, params: Params):
+        self.params = params
+        self.fragments = [fragment(s, params) for s in subcanvasses]
+
+    def replace(self, i, subcanvas: str):
+        self.fragments[i] = fragment(subcanvas, self.params)
+
+    def insert(self, i, subcanvas: str):
+        self.fragments.insert(i, fragment(subcanvas, self.params))
+
+    def remove(self, i):
+        del self.fragments[i]
+
+    def join(self, i):
+        "merge subcanvas i with the one after it (the gap between was deleted)"
+        self.fragments[i : i + 2] = [
+            concat(self.fragments[i], self.fragments[i + 1], self.params)
+        ]
+
+    def fingerprint(self) -> Fragment:
+        whole = Fragment(0, 0)
+        for f in self.fragments:
+            whole = concat(whole, f, self.params)
+        return whole
+
+
+def fingerprint_batch(texts: List[str], params: Params) -> List[Result]:
+    "called in a Fingerprinter's workers"
+    return [all_subs(text, params) for text in texts]
+
+
+class Fingerprinter:
+    """
+    For fingerprinting lots of texts.  all_subs starts (and stops) its
+    worker processes on every call, which costs more than fingerprinting a
+    short text does.  A Fingerprinter starts them once (if params.parallel)
+    and keeps them until it's closed.  Its params are the default for each
+    call, but the params go along with each batch, so one Fingerprinter can
+    serve callers with different params.
+
+    Short texts are packed into batches of about batch_chars characters,
+    and a few batches are kept queued ahead of the workers so that they
+    never wait on the caller (or the caller on them) between documents.
+    """
+
+    def __init__(self, params=Params(), processes=None, batch_chars=1 << 14):
+
+        # each text is scanned serially, in whichever worker it lands on
+        self.params = params.replace(parallel=False)
+        self.batch_chars = batch_chars
+        self.pool = None
+        if params.parallel:
+            processes = processes or os.cpu_count() or 1
+            self.pool = Pool(processes)
+            self.ahead = 2 * processes
+
+    def serial(self, params: Optional[Params]) -> Params:
+        return self.params if params is None else params.replace(parallel=False)
+
+    def fingerprint(self, text: str, params=None) -> Result:
+        "one text, scanned in this process (handing it off would only add latency)"
+        return all_subs(text, self.serial(params))
+
+    def fingerprint_many(self, texts: Iterable[str], params=None) -> Iterator[Result]:
+        "a Result for each text, in order"
+
+        params = self.serial(params)
+        if self.pool is None:
+            for text in texts:
+                yield all_subs(text, params)
+            return
+
+        queued = deque()
+        for batch in self.batches(texts):
+            queued.append(self.pool.apply_async(fingerprint_batch, (batch, params)))
+
+            # don't read too far ahead, texts may be arriving from a stream
+            while len(queued) > self.ahead:
+                yield from queued.popleft().get()
+
+        while queued:
+            yield from queued.popleft().get()
+
+    def batches(self, texts: Iterable[str]) -> Iterator[List[str]]:
+
+        batch = []
+        size = 0
+        for text in texts:
+            batch.append(text)
+            size += len(text)
+            if size >= self.batch_chars:
+                yield batch
+                batch = []
+                size = 0
+        if batch:
+            yield batch
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+# asyncio
+#
+# all_subs blocks, so services built on an event loop should use these
+# instead.  (asyncio takes longer to import than the rest of this module,
+# so it's imported when they're called.)  Each text is scanned serially in a process from a shared pool,
+# so many texts (from many callers) can be in progress at once without
+# the event loop waiting on any of them.
+
+Progress = namedtuple("Progress", "index done total result")
+
+shared_executor = None
+
+
+def executor() -> ProcessPoolExecutor:
+    "the pool used by the async functions, unless they're given another"
+
+    global shared_executor
+    if shared_executor is None:
+        shared_executor = ProcessPoolExecutor()
+    return shared_executor
+
+
+async def fingerprint(
+    text: str, params=Params(), timeout: Optional[float] = None, pool=None
+) -> Result:
+    """
+    all_subs, without blocking the event loop.  Raises asyncio.TimeoutError
+    if the result isn't ready in timeout seconds.  Cancelling (or timing
+    out) before a worker has picked up the text keeps it from being
+    scanned at all.
+    """
+
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    work = loop.run_in_executor(
+        pool or executor(), all_subs, text, params.replace(parallel=False)
+    )
+    return await asyncio.wait_for(work, timeout)
+
+
+async def fingerprint_many(
+    texts: Iterable[str], params=Params(), timeout: Optional[float] = None, pool=None
+) -> AsyncIterator[Progress]:
+    """
+    Fingerprint each of the texts, yielding a Progress as each one finishes
+    (in whatever order that happens).  Progress.index says which text the
+    result is for.
+
+    timeout is a deadline for the whole lot.  If it passes, or if the
+    caller stops iterating early, texts that haven't been started are
+    cancelled.
+    """
+
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+
+    tasks = {
+        asyncio.ensure_future(fingerprint(text, params, pool=pool)): index
+        for index, text in enumerate(texts)
+    }
+    pending = set(tasks)
+    done = 0
+
+    try:
+        while pending:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError()
+
+            finished, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in finished:
+                done += 1
+                yield Progress(tasks[task], done, len(tasks), task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+
+
 def fromcli():
 
     parser = argparse.ArgumentParser(description="read stdin, write gnize fingerprints")
@@ -525,13 +1350,15 @@ def fromcli():
 
     # -a => print every fingerprint, not just the interesting ones
     if args.all:
-        params.max_prefix_len = 0
-        params.skip_prefix = True
-        params.prefix_threshold = 0xFFFF
-        params.feature_threshold = 0xFFFF
+        params = params.replace(
+            max_prefix_len=0,
+            skip_prefix=True,
+            prefix_threshold=0xFFFF,
+            feature_threshold=0xFFFF,
+        )
 
     if args.serial:
-        params.parallel = False
+        params = params.replace(parallel=False)
 
     fingerprints, stats = all_subs(message, params)
 
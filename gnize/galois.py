@@ -1,5 +1,6 @@
 # thanks to Baylor University for: https://baylor-ir.tdl.org/bitstream/handle/2104/8792/GF2%20Polynomials.pdf
 # each channel is a degree 15 primitive polynomials over GF2
+# (see the end of this file for wider channels)
 channel = {
     0: 32771,
     1: 32785,
@@ -1802,3 +1803,213 @@ channel = {
     1798: 65519,
     1799: 65533,
 }
+
+# Wider channels, for stores big enough that 16-bit fingerprints collide too
+# often.  Channel 31000 + i is the first degree 31 primitive polynomial over
+# GF2 counting up from
+#
+#     seed = sha256(b"gnize degree 31 channel %d" % i).digest()
+#     (1 << 31) | int.from_bytes(seed, "big") % (1 << 31) | 1
+#
+# and likewise 63000 + i for degree 63.  They were found with `primitive`
+# (below) and tests/test_galois.py checks them.
+#
+# They aren't the first primitive polynomials after x^n + 1, because those
+# are sparse: modulo them x^n is a polynomial of low degree, so the bits
+# that overflow a shift land back in the lowest bits, and the highest bits
+# of a fingerprint are little more than the characters digested a few steps
+# before.  Comparing fingerprints to thresholds needs the highest bits mixed.
+channel31 = {
+    31000: 3209171011,
+    31001: 3621478119,
+    31002: 3911701289,
+    31003: 2425871217,
+    31004: 2791805369,
+    31005: 2447218221,
+    31006: 2478206425,
+    31007: 2258971245,
+    31008: 2698346357,
+    31009: 2684730899,
+    31010: 3160897041,
+    31011: 3209343619,
+    31012: 3198035887,
+    31013: 4207022867,
+    31014: 3361446063,
+    31015: 3884307391,
+    31016: 2247087485,
+    31017: 2579485211,
+    31018: 3815266099,
+    31019: 3890370175,
+    31020: 2180885605,
+    31021: 2265280023,
+    31022: 4021539785,
+    31023: 4025367501,
+    31024: 3929766817,
+    31025: 2903270673,
+    31026: 2319761201,
+    31027: 4064967793,
+    31028: 2675376285,
+    31029: 3614261477,
+    31030: 4056238479,
+    31031: 2993247961,
+    31032: 3471956747,
+    31033: 3965769791,
+    31034: 2987379051,
+    31035: 3257363471,
+    31036: 2148187811,
+    31037: 3004285253,
+    31038: 3765791805,
+    31039: 4061436809,
+    31040: 3046834175,
+    31041: 3145904755,
+    31042: 2305399215,
+    31043: 2918801513,
+    31044: 3202411019,
+    31045: 2509989611,
+    31046: 2913901017,
+    31047: 3389084585,
+    31048: 3703664137,
+    31049: 3941045723,
+    31050: 3953181495,
+    31051: 2514645991,
+    31052: 2779233317,
+    31053: 2974184113,
+    31054: 2647085571,
+    31055: 2664872685,
+    31056: 2330776667,
+    31057: 3991676393,
+    31058: 2661532317,
+    31059: 2457171257,
+    31060: 3326792947,
+    31061: 2865834365,
+    31062: 2828226907,
+    31063: 2862724149,
+}
+
+channel63 = {
+    63000: 11195395166337495429,
+    63001: 9867465886846030191,
+    63002: 17584108032484568847,
+    63003: 12219243850687082807,
+    63004: 10781995807849291209,
+    63005: 11523125699671387897,
+    63006: 15556622331185228135,
+    63007: 18266363019085124807,
+    63008: 14290141974464190181,
+    63009: 16906834713031076533,
+    63010: 11695100406837974841,
+    63011: 11053878945001840231,
+    63012: 17695106627416563131,
+    63013: 16063702639656815629,
+    63014: 10470200401113471661,
+    63015: 14383515165007596209,
+    63016: 15507101899447731483,
+    63017: 13139681482532722053,
+    63018: 14487850772256801481,
+    63019: 18168934528695002477,
+    63020: 14294879379333972841,
+    63021: 16125448224941433811,
+    63022: 18311725064132581201,
+    63023: 15998399486948947801,
+    63024: 16446551916988422527,
+    63025: 17126891719664372073,
+    63026: 12239638898097147535,
+    63027: 13029881399091825383,
+    63028: 14424442437956150837,
+    63029: 9749544578770601713,
+    63030: 15422735179981361121,
+    63031: 11377030981200570423,
+    63032: 16150967124633628505,
+    63033: 13839648935515755991,
+    63034: 11840792363629283437,
+    63035: 14687629427124804025,
+    63036: 16924449765263563011,
+    63037: 12946258532622027421,
+    63038: 10966146874410159861,
+    63039: 14584710204386214805,
+    63040: 17055115736410287207,
+    63041: 11328116624848025103,
+    63042: 10324849254690017805,
+    63043: 14884538191708158191,
+    63044: 10128656143349633733,
+    63045: 10908301007472664011,
+    63046: 14412806703797526391,
+    63047: 10630927716702744759,
+    63048: 10188632809215031625,
+    63049: 12546545007526046727,
+    63050: 14687961666141219509,
+    63051: 10219637559685166063,
+    63052: 15800827313202856705,
+    63053: 17134661475710288859,
+    63054: 15586690760356073733,
+    63055: 15169489264920491821,
+    63056: 10336578734736504465,
+    63057: 9228551863823356857,
+    63058: 17488278171676682285,
+    63059: 10506494186864789809,
+    63060: 18005029456672288137,
+    63061: 15913730874174016891,
+    63062: 10461641680774253593,
+    63063: 11975019973636033821,
+}
+
+channels = {**channel, **channel31, **channel63}
+
+
+# prime factors of 2^n - 1, for each degree n that has channels
+order_factors = {
+    15: [7, 31, 151],
+    31: [2147483647],
+    63: [7, 73, 127, 337, 92737, 649657],
+}
+
+
+def degree(polynomial: int) -> int:
+    return polynomial.bit_length() - 1
+
+
+def gf2_mod(a: int, polynomial: int) -> int:
+    "remainder of polynomial division over GF(2)"
+
+    d = degree(polynomial)
+    while a.bit_length() > d:
+        a ^= polynomial << (a.bit_length() - 1 - d)
+    return a
+
+
+def gf2_mulmod(a: int, b: int, polynomial: int) -> int:
+    "a * b over GF(2), reduced by the polynomial"
+
+    product = 0
+    while b:
+        if b & 1:
+            product ^= a
+        a <<= 1
+        b >>= 1
+    return gf2_mod(product, polynomial)
+
+
+def x_power(exponent: int, polynomial: int) -> int:
+    "x^exponent mod polynomial"
+
+    power, square = 1, 2
+    while exponent:
+        if exponent & 1:
+            power = gf2_mulmod(power, square, polynomial)
+        square = gf2_mulmod(square, square, polynomial)
+        exponent >>= 1
+    return power
+
+
+def primitive(polynomial: int) -> bool:
+    """
+    Is x a generator of GF(2^n) when taken modulo this polynomial?  Then
+    the polynomial is irreducible, and remainders cycle through every
+    nonzero value before repeating.
+    """
+
+    n = degree(polynomial)
+    order = (1 << n) - 1
+    if not polynomial & 1 or x_power(order, polynomial) != 1:
+        return False
+    return all(x_power(order // q, polynomial) != 1 for q in order_factors[n])
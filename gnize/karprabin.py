@@ -0,0 +1,104 @@
+"""
+# Purpose
+
+This module provides a second family of channels.  Instead of dividing by
+a polynomial over GF(2) (see galois.py), these fingerprint text by the
+classic Karp-Rabin polynomial hash, modulo the Mersenne prime 2^61 - 1:
+
+    buf(n) = (buf(n-1) + codepoint + 1) * base mod (2^61 - 1)
+
+(Multiplying after adding, rather than before, keeps short substrings
+from having small fingerprints, small is what makes them interesting.)
+
+Python does that in one multiplication and one remainder per character,
+and there's no utf-8 encoding or splitting characters into two-byte
+chunks, so it is several times faster than the galois channels.
+
+The fingerprints are unrelated to galois fingerprints, so cognizer and
+recognizer must agree on the family, just as they must agree on a
+channel.  Channel numbers start at 61000 so that they never collide with
+galois channel numbers.
+
+The bases were derived like so (tests/test_karprabin.py checks them):
+
+    int.from_bytes(sha256(b"gnize karp-rabin %d" % i).digest(), "big") % modulus
+"""
+
+bits = 61
+modulus = (1 << bits) - 1
+
+channel = {
+    61000: 1574592354225417327,
+    61001: 1038546980296827176,
+    61002: 1672278752756515835,
+    61003: 387082158757635820,
+    61004: 1282936784518238060,
+    61005: 1033197115434576648,
+    61006: 1175446989883203870,
+    61007: 716019826024900994,
+    61008: 1681447507282993041,
+    61009: 997976637056592025,
+    61010: 2301246122343467365,
+    61011: 2184803600710028176,
+    61012: 1978694615349240262,
+    61013: 1664331058329416776,
+    61014: 224719731866938999,
+    61015: 1609363679377972270,
+    61016: 2230448812079698440,
+    61017: 1226201944188665924,
+    61018: 1959070960319207019,
+    61019: 1189577567066993360,
+    61020: 1112422077117738954,
+    61021: 1133862964059899936,
+    61022: 1080324228011720761,
+    61023: 1934047515704395194,
+    61024: 1148400221059932302,
+    61025: 1506547803573916260,
+    61026: 2139781630112868912,
+    61027: 1169561967713524388,
+    61028: 1544397565823674439,
+    61029: 1028524741874446404,
+    61030: 73461927269075606,
+    61031: 1047145968072614410,
+    61032: 1320398018730523152,
+    61033: 172069383563520206,
+    61034: 1122659671665293629,
+    61035: 1855012036867532890,
+    61036: 1045382324319673136,
+    61037: 324702930466336028,
+    61038: 675013831885022502,
+    61039: 1275805614804254475,
+    61040: 105946850509855592,
+    61041: 817665630891846995,
+    61042: 1019172795291227454,
+    61043: 317067204949026289,
+    61044: 989391684892550550,
+    61045: 2065635972352994764,
+    61046: 1613614279365727203,
+    61047: 305442415340553695,
+    61048: 467530286038875621,
+    61049: 1799845150590401018,
+    61050: 1214793770155351319,
+    61051: 755842603163859817,
+    61052: 593628581559104760,
+    61053: 2283449497819340493,
+    61054: 1879279479108565949,
+    61055: 2163880472462686907,
+    61056: 1784529644335943551,
+    61057: 268683748752996367,
+    61058: 1552022128880823958,
+    61059: 1039077354534855774,
+    61060: 802068672587741406,
+    61061: 1061860634786520442,
+    61062: 2236088518060453716,
+    61063: 2051464839248132315,
+}
+
+
+def digest_char(c: str, buffer: int, base: int) -> int:
+    return (buffer + ord(c) + 1) * base % modulus
+
+
+def shift(chars: int, base: int) -> int:
+    "what a fingerprint is multiplied by when chars more are digested"
+    return pow(base, chars, modulus)
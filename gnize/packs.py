@@ -0,0 +1,205 @@
+"""
+# Purpose
+
+This module implements the file formats for the `packfile` canvas store
+(see store.py).
+
+Storing each canvas in a file of its own costs an inode per canvas, and
+a directory with millions of entries is slow to list or back up.
+Instead, canvasses are appended to a few large pack files, and found
+through indexes that map each canvas's multihash to where it lives:
+
+    pack:    chunks and recipes (see below), back to back, nothing else
+    index:   header, then count fixed-width entries sorted by name
+    header:  magic, version, entry count
+    entry:   multihash (34 bytes), pack number, offset, length
+
+Like segments, an index is immutable once written and is searched in
+place through mmap, so finding a canvas is a binary search over each
+index followed by a single read from a pack.
+
+Near-duplicate canvasses (the same signal, cognized again with a few
+changes) are common, so canvasses aren't packed whole.  Each is cut into
+chunks where the text itself says to: wherever the rolling fingerprint of
+the last few dozen characters has its low bits set.  An edit only moves
+the cuts near it, so the other chunks of an edited canvas are the same as
+before, and only need to be stored once.  The pack then holds each
+distinct chunk, plus a recipe for each canvas: the names of its chunks,
+in order.
+
+    canvas -> recipe:  chunk multihash, chunk multihash, ...
+    chunk  -> its text
+"""
+
+import mmap
+import struct
+from bisect import bisect_left
+from functools import lru_cache
+from heapq import merge
+from pathlib import Path
+from typing import List
+
+from gnize.features import Params, shift
+from gnize.galois import gf2_mulmod
+
+magic = b"GNPK"
+version = 2
+header = struct.Struct("<4sIQ")
+entry = struct.Struct("<34sIQI")
+
+# the raw bytes of a sha2-256 multihash: a two byte prefix and the digest
+name_size = 34
+
+# see chunk
+chunk_params = Params(channel=31000, parallel=False)
+chunk_window = 48
+chunk_mask = (1 << 10) - 1
+min_chunk = 256
+max_chunk = 8192
+
+
+@lru_cache(maxsize=None)
+def leaving() -> List[int]:
+    "what each byte still contributes to the digest chunk_window bytes later"
+
+    polynomial = chunk_params.channel_polynomial
+    power = shift(chunk_window, polynomial)
+    return [gf2_mulmod(b, power, polynomial) for b in range(256)]
+
+
+def chunk(data: bytes) -> List[bytes]:
+    """
+    Cut data where the fingerprint of the chunk_window bytes before the
+    cut has the bits of chunk_mask set (about every 1k bytes), but into
+    pieces no shorter than min_chunk or longer than max_chunk
+
+    This is rolling (see features.py), with digest inlined for single
+    bytes, since it runs over everything that's stored.
+    """
+
+    table = chunk_params.channel_table
+    low = (1 << (chunk_params.channel_degree - 16)) - 1
+    high = chunk_params.channel_degree - 16
+    out = leaving()
+
+    pieces = []
+    start = 0
+    buffer = 0
+    for end, byte in enumerate(data, 1):
+        buffer = table[buffer >> high] ^ ((buffer & low) << 16) ^ byte
+        if end > chunk_window:
+            buffer ^= out[data[end - 1 - chunk_window]]
+
+        size = end - start
+        if size >= max_chunk or (
+            size >= min_chunk
+            and end >= chunk_window
+            and buffer & chunk_mask == chunk_mask
+        ):
+            pieces.append(data[start:end])
+            start = end
+
+    if start < len(data):
+        pieces.append(data[start:])
+    return pieces
+
+
+class Names:
+    "the names in an index, as a sequence of bytes that bisect can search"
+
+    def __init__(self, view, count):
+        self.view = view
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = header.size + i * entry.size
+        return bytes(self.view[start : start + name_size])
+
+
+class Index:
+    "A read-only view of an index file"
+
+    def __init__(self, path):
+
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        found, found_version, self.count = header.unpack_from(self._map, 0)
+        if found != magic or found_version != version:
+            self.close()
+            raise ValueError(f"{self.path} is not a gnize pack index")
+        self.names = Names(self._map, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def find(self, name: bytes):
+        "(pack, offset, length) for the named canvas, or None"
+
+        i = bisect_left(self.names, name)
+        if i < self.count and self.names[i] == name:
+            return entry.unpack_from(self._map, header.size + i * entry.size)[1:]
+        return None
+
+    def entries(self):
+        for i in range(self.count):
+            yield entry.unpack_from(self._map, header.size + i * entry.size)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def write_index(path, entries) -> Index:
+    """
+    Write (name, pack, offset, length) tuples, which must already be sorted
+    by name, to a new index file
+    """
+
+    path = Path(path)
+    body = bytearray()
+    for values in entries:
+        body += entry.pack(*values)
+
+    staging = path.with_suffix(path.suffix + ".new")
+    with open(staging, "wb") as f:
+        f.write(header.pack(magic, version, len(body) // entry.size))
+        f.write(body)
+    staging.replace(path)
+
+    return Index(path)
+
+
+def merge_indexes(path, indexes) -> Index:
+    "combine several indexes into one"
+
+    return write_index(
+        path, merge(*[index.entries() for index in indexes], key=lambda e: e[0])
+    )
+
+
+class Pack:
+    "A pack file, mapped for reading"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map = None
+
+    def read(self, offset: int, length: int) -> bytes:
+
+        # the pack may have grown since it was mapped
+        if self._map is None or offset + length > len(self._map):
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset : offset + length]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
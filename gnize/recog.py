@@ -0,0 +1,184 @@
+"""
+# Purpose
+
+This module implements `recog`.  Given some noise, it calculates
+fingerprints (the same way that the cognizer did) and asks the fingerprint
+store which canvasses have them.  Canvasses that share many fingerprints
+with the noise are likely to be hiding in it.
+
+Most of the noise's fingerprints won't be stored anywhere, so the store's
+bloom filter gets the first look at each one.  A prefix that the filter
+hasn't seen rules out every feature that follows it, and only the
+fingerprints which survive both checks are looked up in sqlite.
+
+Some fingerprints (typically from boilerplate) are found in so many
+canvasses that they say nothing about which one is hiding in the noise.
+The store keeps count, and those on its stop list are skipped rather than
+allowed to drag every canvas that has them into the running.
+
+The rest are weighed by rarity: a fingerprint found in n canvasses is
+worth 1/n of a vote to each of them.  Rare fingerprints are looked up
+first, and the lookups stop as soon as the leaders can't be caught (this
+is Fagin's threshold algorithm, more or less), so the common fingerprints
+at the end of the list are usually never fetched.
+
+Votes alone don't care where the fingerprints were found, but a canvas
+that is really hiding in the noise will have its fingerprints show up in
+the same order that they appear in the canvas.  So the leaders are scored
+by the longest chain of matches that is in order in both the noise and
+the canvas.  Matches that are out of order are usually coincidences, and
+the chain says where in the noise each subcanvas was found.
+"""
+
+import heapq
+from bisect import bisect_left
+from collections import Counter, defaultdict, namedtuple
+from typing import Dict, List, Optional, Tuple
+
+from gnize.features import Params, all_subs
+from gnize.store import fingerprint_key
+
+Tally = namedtuple("Tally", "canvas_hash votes rows")
+Candidate = namedtuple("Candidate", "canvas_hash votes chain")
+
+# a fingerprint found at begin:end in the noise and at sub_idx in a subcanvas
+Match = namedtuple("Match", "begin end canvas sub_idx len")
+
+
+def candidate_prints(fingerprints, store):
+    "drop fingerprints that the store definitely doesn't have"
+
+    for p in fingerprints.prints():
+        if not store.might_contain_prefix(p.channel, p.prefix):
+            continue
+        if not store.might_contain(p.channel, p.prefix, p.feature):
+            continue
+        yield p
+
+
+def rank(
+    store, channel: int, frequencies: Dict[int, int], limit: Optional[int] = 10
+) -> List[Tally]:
+    """
+    Find the limit canvasses with the most (rarity weighted) votes
+
+    Postings are fetched rarest first.  After each batch, the votes not yet
+    cast are an upper bound on what any canvas can still gain.  Once the
+    k-th best canvas leads the best of the rest by more than that, the
+    top k can't change, so the remaining postings are skipped.
+    """
+
+    order = sorted(frequencies, key=lambda key: (frequencies[key], key))
+    weights = {key: 1 / frequencies[key] for key in order}
+    uncast = sum(weights.values())
+
+    votes = Counter()
+    voted = set()
+    rows = defaultdict(list)
+    batch_size = 16
+
+    while order:
+        batch, order = order[:batch_size], order[batch_size:]
+        batch_size *= 2
+
+        for row in store.lookup(channel, batch):
+            rows[row.canvas_hash].append(row)
+
+            # a canvas that repeats a fingerprint gets just one vote for it
+            if (row.canvas_hash, row.fingerprint) not in voted:
+                voted.add((row.canvas_hash, row.fingerprint))
+                votes[row.canvas_hash] += weights[row.fingerprint]
+
+        uncast -= sum(weights[key] for key in batch)
+
+        if limit and len(votes) >= limit:
+            leaders = heapq.nlargest(limit + 1, votes.values())
+            kth = leaders[limit - 1]
+            runner_up = leaders[limit] if len(leaders) > limit else 0
+            if kth >= runner_up + uncast:
+                break
+
+    leaders = heapq.nlargest(limit or len(votes), votes.items(), key=lambda v: v[1])
+    return [Tally(name, count, rows[name]) for name, count in leaders]
+
+
+def chain(matches: List[Match]) -> List[Match]:
+    """
+    The longest list of matches that is in order in the noise and in the
+    canvas (patience sorting, O(k log k) for k matches)
+    """
+
+    # among matches that start together in the noise, only one may be used,
+    # visiting them in descending canvas order keeps the chain from taking two
+    def canvas_position(m):
+        return (m.canvas, m.sub_idx)
+
+    ordered = sorted(matches, key=lambda m: (m.begin, -m.canvas, -m.sub_idx))
+
+    tails = []  # canvas position of the last match in the best chain of each length
+    tail_idx = []
+    previous = [None] * len(ordered)
+
+    for i, m in enumerate(ordered):
+        length = bisect_left(tails, canvas_position(m))
+        if length == len(tails):
+            tails.append(canvas_position(m))
+            tail_idx.append(i)
+        else:
+            tails[length] = canvas_position(m)
+            tail_idx[length] = i
+        previous[i] = tail_idx[length - 1] if length else None
+
+    found = []
+    i = tail_idx[-1] if tail_idx else None
+    while i is not None:
+        found.append(ordered[i])
+        i = previous[i]
+    return found[::-1]
+
+
+def spans(matches: List[Match]) -> Dict[int, Tuple[int, int]]:
+    "for each subcanvas in the chain, the part of the noise where it was found"
+
+    found = {}
+    for m in matches:
+        begin, end = found.get(m.canvas, (m.begin, m.end))
+        found[m.canvas] = (min(begin, m.begin), max(end, m.end))
+    return found
+
+
+def recog(
+    noise: str, store, params=Params(), limit: Optional[int] = 10
+) -> List[Candidate]:
+    """
+    Rank the stored canvasses by how many of their fingerprints appear
+    in the noise
+    """
+
+    fingerprints, _ = all_subs(noise, params)
+
+    keys = {
+        fingerprint_key(p.channel, p.prefix, p.feature)
+        for p in candidate_prints(fingerprints, store)
+    }
+    keys -= store.stop_list(params.channel, keys)
+    frequencies = {
+        key: frequency
+        for key, frequency in store.frequencies(params.channel, keys).items()
+        if frequency
+    }
+
+    found = defaultdict(list)
+    for p in fingerprints.prints():
+        found[fingerprint_key(p.channel, p.prefix, p.feature)].append(p)
+
+    candidates = []
+    for tally in rank(store, params.channel, frequencies, limit):
+        matches = [
+            Match(p.begin, p.end, row.canvas, row.sub_idx, row.len)
+            for row in tally.rows
+            for p in found[row.fingerprint]
+        ]
+        candidates.append(Candidate(tally.canvas_hash, tally.votes, chain(matches)))
+
+    return sorted(candidates, key=lambda c: (len(c.chain), c.votes), reverse=True)
@@ -0,0 +1,151 @@
+"""
+# Purpose
+
+This module implements the file format for the `segments` fingerprint
+store (see store.py).
+
+A segment is an immutable file of fixed-width records, sorted by key.  The
+keys are stored contiguously so that, once the file is mapped into memory,
+they can be binary searched without parsing anything.  A batch of sorted
+query keys is answered in one sweep: each search starts where the previous
+one ended.
+
+Segments are never modified.  New fingerprints go into new (small)
+segments, and small segments are merged into bigger ones later, so readers
+never see a half-written index.
+
+    header:  magic, version, words per key, record count
+    keys:    count * words * u64 (most significant word first)
+    records: count * (canvas_id, canvas, sub_idx, len) as u32's
+
+Keys are one word wide for fingerprints from channels of degree 31 or
+less, and two words for wider ones.
+"""
+
+import mmap
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from pathlib import Path
+import struct
+
+magic = b"GNSG"
+version = 2
+header = struct.Struct("<4sIIQ")
+record = struct.Struct("<IIII")
+
+
+class WideKeys:
+    "a sequence of two-word keys, read as 128 bit ints"
+
+    def __init__(self, words):
+        self.words = words
+
+    def __len__(self):
+        return len(self.words) // 2
+
+    def __getitem__(self, i):
+        return (self.words[2 * i] << 64) | self.words[2 * i + 1]
+
+
+class Segment:
+    "A read-only view of a segment file"
+
+    def __init__(self, path):
+
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        found, found_version, self.words, self.count = header.unpack_from(self._map, 0)
+        if found != magic or found_version != version:
+            self.close()
+            raise ValueError(f"{self.path} is not a gnize segment")
+
+        keys_end = header.size + 8 * self.words * self.count
+        self._view = memoryview(self._map)
+        if sys.byteorder == "little":
+            self._words = self._view[header.size : keys_end].cast("Q")
+        else:
+            self._words = array("Q", self._view[header.size : keys_end])
+            self._words.byteswap()
+        self.keys = self._words if self.words == 1 else WideKeys(self._words)
+        self._records = keys_end
+
+    def __len__(self):
+        return self.count
+
+    def record(self, i):
+        return record.unpack_from(self._map, self._records + i * record.size)
+
+    def search(self, sorted_keys):
+        "yield (index, key) for each stored record whose key was asked for"
+
+        lo = 0
+        for key in sorted_keys:
+            lo = bisect_left(self.keys, key, lo)
+            if lo == self.count:
+                return
+            hi = bisect_right(self.keys, key, lo)
+            for i in range(lo, hi):
+                yield i, key
+            lo = hi
+
+    def canvas_ids(self, sorted_keys):
+        "yield (key, canvas id) for each stored record whose key was asked for"
+
+        for i, key in self.search(sorted_keys):
+            yield key, self.record(i)[0]
+
+    def entries(self):
+        for i in range(self.count):
+            yield self.keys[i], self.record(i)
+
+    def close(self):
+        if hasattr(self, "_words") and isinstance(self._words, memoryview):
+            self._words.release()
+        if hasattr(self, "_view"):
+            self._view.release()
+        self._map.close()
+        self._file.close()
+
+
+def write_segment(path, entries, words=1) -> Segment:
+    """
+    Write (key, record) pairs, which must already be sorted by key, to a
+    new segment file
+    """
+
+    path = Path(path)
+    keys = array("Q")
+    records = bytearray()
+    for key, values in entries:
+        if words == 1:
+            keys.append(key)
+        else:
+            keys.append(key >> 64)
+            keys.append(key & 0xFFFFFFFFFFFFFFFF)
+        records += record.pack(*values)
+
+    if sys.byteorder != "little":
+        keys.byteswap()
+
+    staging = path.with_suffix(path.suffix + ".new")
+    with open(staging, "wb") as f:
+        f.write(header.pack(magic, version, words, len(keys) // words))
+        f.write(keys.tobytes())
+        f.write(records)
+    staging.replace(path)
+
+    return Segment(path)
+
+
+def merge_segments(path, segments) -> Segment:
+    "combine several segments into one"
+
+    return write_segment(
+        path,
+        merge(*[s.entries() for s in segments], key=lambda e: e[0]),
+        words=segments[0].words,
+    )
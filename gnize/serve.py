@@ -0,0 +1,205 @@
+"""
+# Purpose
+
+This module implements `gn serve`, a daemon that keeps everything `gn` and
+`recog` need warm (worker pools, channel tables, the result cache, an open
+fingerprint store) so that a short message doesn't wait on the imports and
+setup that dominate a fresh process.  It also implements the client side,
+which only needs the standard library.
+
+The daemon listens on a unix socket (~/.gnize/gn.sock by default).  Each
+request is a line of json, and each response is streamed back as lines of
+json, ending with {"done": true}:
+
+    -> {"op": "fingerprint", "texts": ["..."], "params": {"channel": 5},
+        "format": "json"}
+    <- {"index": 0, "fingerprints": "...", "stats": "..."}
+    <- {"done": true}
+
+    -> {"op": "recog", "noise": "...", "limit": 10, "locate": true}
+    <- {"candidates": [[chain length, votes, canvas hash, spans], ...]}
+    <- {"done": true}
+
+params are overrides of the defaults in features.Params.  Several texts
+in one request are spread over a warm worker pool, and their results are
+streamed back in order as they finish.
+
+Requests are handled one at a time, in the daemon's main thread, since
+that's where its sqlite connection lives.
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+from pathlib import Path
+
+# see dotdir.dir_path
+default_socket = Path.home() / ".gnize" / "gn.sock"
+
+
+class DaemonError(Exception):
+    "the daemon couldn't handle a request"
+
+
+def request(path, message: dict):
+    "send a request to the daemon at path, yield its responses"
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(path))
+        connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+        with connection.makefile("r", encoding="utf-8") as responses:
+            for line in responses:
+                response = json.loads(line)
+                if "error" in response:
+                    raise DaemonError(response["error"])
+                if response.get("done"):
+                    return
+                yield response
+
+    raise DaemonError("the daemon hung up")
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+
+        try:
+            for line in self.rfile:
+                try:
+                    for response in self.server.respond(json.loads(line)):
+                        self.send(response)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    self.send({"error": f"{type(e).__name__}: {e}"})
+                self.send({"done": True})
+
+        # the client stopped listening (e.g. gn -S | head), that's its business
+        except ConnectionError:
+            pass
+
+    def send(self, response: dict):
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class Server(socketserver.UnixStreamServer):
+    """
+    Holds the warm state between requests.  The fingerprint store and the
+    config it comes from are opened on the first recog request.
+    """
+
+    def __init__(self, path=default_socket, config=None):
+
+        # the client doesn't need any of this, so it's imported here
+        from gnize import cache
+        from gnize.features import Params
+
+        self.path = Path(path)
+        self.config = config
+        self.store = None
+        self.params = Params(cache=cache.default_path)
+        self.workers = None
+
+        # a socket file left behind by a daemon that didn't shut down cleanly
+        if self.path.exists():
+            try:
+                with socket.socket(socket.AF_UNIX) as probe:
+                    probe.connect(str(self.path))
+            except ConnectionRefusedError:
+                self.path.unlink()
+            else:
+                raise DaemonError(f"a daemon is already listening on {self.path}")
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(self.path), Handler)
+
+    def respond(self, request: dict):
+
+        op = request.get("op", "fingerprint")
+        params = self.params.replace(**request.get("params", {}))
+        if op == "fingerprint":
+            yield from self.fingerprint(request, params)
+        elif op == "recog":
+            yield self.recog(request, params)
+        else:
+            raise ValueError(f"unknown op: {op}")
+
+    def fingerprint(self, request: dict, params):
+
+        from gnize.features import all_subs
+
+        # a single text is scanned here, handing it off would only add latency
+        texts = request["texts"]
+        if len(texts) > 1 and params.parallel:
+            results = self.fingerprinter().fingerprint_many(texts, params)
+        else:
+            results = (all_subs(t, params.replace(parallel=False)) for t in texts)
+
+        for index, (fingerprints, stats) in enumerate(results):
+            stats.finalize()
+            if request.get("format") == "text":
+                rendered = str(fingerprints)
+            else:
+                rendered = fingerprints.as_json()
+            yield {"index": index, "fingerprints": rendered, "stats": str(stats)}
+
+    def fingerprinter(self):
+        "the warm worker pool, shared by all params, started when first needed"
+
+        from gnize.features import Fingerprinter
+
+        if self.workers is None:
+            self.workers = Fingerprinter(self.params.replace(parallel=True))
+        return self.workers
+
+    def recog(self, request: dict, params) -> dict:
+
+        from gnize import dotdir
+        from gnize.align import locate
+        from gnize.recog import recog
+        from gnize.store import open_store, read_canvas
+
+        if self.store is None:
+            self.config = self.config or dotdir.make_or_get()
+            self.store = open_store(self.config)
+
+        noise = request["noise"]
+        candidates = []
+        for candidate in recog(noise, self.store, params, request.get("limit", 10)):
+            spans = []
+            if request.get("locate"):
+                canvas = read_canvas(self.config, candidate.canvas_hash)
+                spans = [list(span) for span in locate(noise, canvas, candidate.chain)]
+            candidates.append(
+                [len(candidate.chain), candidate.votes, candidate.canvas_hash, spans]
+            )
+        return {"candidates": candidates}
+
+    def server_close(self):
+
+        super().server_close()
+        if self.workers is not None:
+            self.workers.close()
+        if self.store is not None:
+            self.store.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def serve(path=default_socket):
+
+    # exit through server_close, which removes the socket
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    with Server(path) as server:
+        print(f"gn: listening on {server.path} (pid {os.getpid()})", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,951 @@
+"""
+# Purpose
+
+This module writes cognized canvasses and their fingerprints to the places
+named in ~/.gnize/config.yaml, and answers the questions that recognizers
+ask of them.
+
+A canvas is a list of strings (subcanvasses), see cog.py.  It is stored
+under the multihash of its json representation, and each subcanvas is
+fingerprinted separately so that the noise between them can't corrupt the
+fingerprints.  A row in the prints table says: this fingerprint was found
+in that subcanvas of that canvas, starting at sub_idx and spanning len
+characters.
+
+Canvasses are kept either as one file each (canvasses.use: filesystem)
+or appended to a few big pack files (canvasses.use: packfile, see
+packs.py), which scales to millions of them without as many inodes.
+
+Both places keep a running count of what they hold (the canvas directory
+in its MANIFEST, the stores alongside their fingerprints) so that
+reporting on them doesn't mean reading all of it.  `gn --reindex` counts
+everything again, in case the totals are ever wrong.
+"""
+
+import fcntl
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import Counter, defaultdict, namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+import multihash
+
+from gnize import dotdir
+from gnize.bloom import BloomFilter, prefix_token, print_token, rebuild
+from gnize.features import Params, all_subs, fingerprint_bits
+from gnize.packs import Index, Pack, chunk, merge_indexes, name_size, write_index
+from gnize.segments import Segment, merge_segments, write_segment
+
+Row = namedtuple("Row", "channel fingerprint repeat_num canvas_hash canvas sub_idx len")
+
+# sqlite complains about statements with too many variables
+max_variables = 500
+
+
+def canvas_hash(canvas: List[str]) -> str:
+    return bytes_hash(canvas_bytes(canvas))
+
+
+def bytes_hash(data: bytes) -> str:
+    digest = hashlib.sha256(data).digest()
+    return multihash.to_b58_string(multihash.encode(digest, "sha2-256"))
+
+
+def canvas_bytes(canvas: List[str]) -> bytes:
+    return json.dumps(canvas).encode("utf-8")
+
+
+def key_bits(channel: int) -> int:
+    "how wide a prefix (or feature) from this channel can be"
+    return fingerprint_bits(channel)
+
+
+def wide(channel: int) -> bool:
+    "too wide for a prefix and feature to share a 64 bit column"
+    return key_bits(channel) > 32
+
+
+def fingerprint_key(channel: int, prefix: int, feature: int) -> int:
+    "prefix and feature, as a single int"
+    return (prefix << key_bits(channel)) | feature
+
+
+def split_key(channel: int, key: int):
+    bits = key_bits(channel)
+    return key >> bits, key & ((1 << bits) - 1)
+
+
+def write_canvas(config: dotdir.Config, canvas: List[str]) -> str:
+    return write_canvasses(config, [canvas])[0]
+
+
+def write_canvasses(config: dotdir.Config, canvasses: Iterable[List[str]]) -> List[str]:
+    "store several canvasses at once, return their names"
+
+    named = []
+    for canvas in canvasses:
+        data = canvas_bytes(canvas)
+        named.append((bytes_hash(data), data))
+
+    if config.canvasses.use == "filesystem":
+        canvas_dir = Path(config.canvasses.path)
+        canvas_dir.mkdir(parents=True, exist_ok=True)
+        new = 0
+        for name, data in named:
+            path = canvas_dir / name
+            if not path.exists():
+                path.write_bytes(data)
+                new += 1
+        if new:
+            canvas_count(canvas_dir, new=new)
+    elif config.canvasses.use == "packfile":
+        with CanvasPacks(config.canvasses.path) as packs:
+            packs.add(named)
+    else:
+        raise NotImplementedError(f"canvasses.use: {config.canvasses.use}")
+    return [name for name, _ in named]
+
+
+def read_canvas(config: dotdir.Config, name: str) -> List[str]:
+
+    if config.canvasses.use == "filesystem":
+        path = Path(config.canvasses.path) / name
+        return json.loads(path.read_bytes().decode("utf-8"))
+    if config.canvasses.use == "packfile":
+        with CanvasPacks(config.canvasses.path) as packs:
+            return json.loads(packs.read(name).decode("utf-8"))
+    raise NotImplementedError(f"canvasses.use: {config.canvasses.use}")
+
+
+def is_canvas(name: str) -> bool:
+    "is this file name a canvas hash (rather than, say, the MANIFEST)"
+
+    try:
+        return multihash.is_valid(multihash.from_b58_string(name))
+    except ValueError:
+        return False
+
+
+def canvas_count(canvas_dir: Path, new=0, recount=False) -> int:
+    """
+    How many canvasses are in the directory, after adding new to the count
+    in its MANIFEST (which is made by counting, if it doesn't exist yet)
+    """
+
+    canvas_dir = Path(canvas_dir)
+    manifest = canvas_dir / "MANIFEST"
+
+    # several cognizers may be counting at once
+    with open(canvas_dir / "MANIFEST.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        if manifest.exists() and not recount:
+            count = json.loads(manifest.read_text())["canvasses"] + new
+        else:
+            count = sum(1 for child in canvas_dir.iterdir() if is_canvas(child.name))
+
+        if new or recount or not manifest.exists():
+            staging = manifest.with_suffix(".new")
+            staging.write_text(json.dumps({"canvasses": count}))
+            staging.replace(manifest)
+
+    return count
+
+
+def stored_canvasses(config: dotdir.Config) -> int:
+    "how many canvasses are stored, without listing them all"
+
+    if config.canvasses.use == "filesystem":
+        canvas_dir = Path(config.canvasses.path)
+        canvas_dir.mkdir(parents=True, exist_ok=True)
+        return canvas_count(canvas_dir)
+    if config.canvasses.use == "packfile":
+        with CanvasPacks(config.canvasses.path) as packs:
+            return packs.count()
+    raise NotImplementedError(f"canvasses.use: {config.canvasses.use}")
+
+
+def stored_prints(config: dotdir.Config) -> int:
+    "how many fingerprints the store holds, without opening all of it"
+
+    if config.fingerprints.use == "sqlite3":
+        conn = sqlite3.connect(config.fingerprints.connect)
+        dotdir.create_tables(conn)
+        count = SqlitePrints.counter(conn, "prints")
+        conn.close()
+        return count
+
+    if config.fingerprints.use == "segments":
+        manifest = Path(config.fingerprints.connect) / "MANIFEST"
+        if manifest.exists():
+            counters = json.loads(manifest.read_text()).get("counters")
+            if counters:
+                return counters["prints"]
+
+    with open_store(config) as store:
+        return store.count()
+
+
+def reindex(config: dotdir.Config):
+    "count the canvasses and fingerprints again, return (canvasses, prints)"
+
+    if config.canvasses.use == "filesystem":
+        canvas_dir = Path(config.canvasses.path)
+        canvas_dir.mkdir(parents=True, exist_ok=True)
+        canvasses = canvas_count(canvas_dir, recount=True)
+    else:
+        canvasses = stored_canvasses(config)
+
+    with open_store(config) as store:
+        return canvasses, store.reindex()
+
+
+class CanvasPacks:
+    """
+    canvasses.use: packfile, where canvasses.path is a directory of pack
+    files and the indexes into them (see packs.py)
+
+    Recipes and chunks are indexed separately.  Each call to add appends
+    the new chunks and recipes to the newest pack and writes an index of
+    just what it appended, for each kind.  Then, while the index before it
+    is no bigger, the two are merged, so there are only ever about log2(n)
+    indexes to search.  Writers take turns through a lock file, readers
+    see whichever indexes were in the MANIFEST when they opened it.
+    """
+
+    kinds = ["recipes", "chunks"]
+
+    # start a new pack once the newest one is this big
+    pack_size = 1 << 30
+
+    def __init__(self, path):
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.path / "MANIFEST"
+        self.indexes = {kind: [] for kind in CanvasPacks.kinds}
+        self.packs = {}
+        self._load()
+
+    def _close_indexes(self):
+        for indexes in self.indexes.values():
+            for index in indexes:
+                index.close()
+        self.indexes = {kind: [] for kind in CanvasPacks.kinds}
+
+    def _load(self):
+
+        self._close_indexes()
+        while True:
+            if self.manifest_path.exists():
+                manifest = json.loads(self.manifest_path.read_text())
+            else:
+                manifest = {"indexes": {}, "pack": 0, "next": 0}
+            self.pack = manifest["pack"]
+            self.next = manifest["next"]
+
+            try:
+                for kind in CanvasPacks.kinds:
+                    for name in manifest["indexes"].get(kind, []):
+                        self.indexes[kind].append(Index(self.path / name))
+                return
+
+            # merged away by a writer since the MANIFEST was read
+            except FileNotFoundError:
+                self._close_indexes()
+
+    def _write_manifest(self):
+        staging = self.manifest_path.with_suffix(".new")
+        staging.write_text(
+            json.dumps(
+                {
+                    "indexes": {
+                        kind: [index.path.name for index in indexes]
+                        for kind, indexes in self.indexes.items()
+                    },
+                    "pack": self.pack,
+                    "next": self.next,
+                }
+            )
+        )
+        staging.replace(self.manifest_path)
+
+    def _new_index_path(self):
+        path = self.path / f"{self.next:08d}.idx"
+        self.next += 1
+        return path
+
+    def _pack_path(self, number):
+        return self.path / f"{number:08d}.pack"
+
+    def _find(self, kind: str, key: bytes):
+        for index in reversed(self.indexes[kind]):
+            found = index.find(key)
+            if found:
+                return found
+        return None
+
+    def _read(self, found) -> bytes:
+        number, offset, length = found
+        if number not in self.packs:
+            self.packs[number] = Pack(self._pack_path(number))
+        return self.packs[number].read(offset, length)
+
+    def __contains__(self, name: str) -> bool:
+        return self._find("recipes", multihash.from_b58_string(name)) is not None
+
+    def count(self, kind="recipes") -> int:
+        return sum(len(index) for index in self.indexes[kind])
+
+    def read(self, name: str) -> bytes:
+
+        found = self._find("recipes", multihash.from_b58_string(name))
+        if found is None:
+            raise KeyError(name)
+
+        recipe = self._read(found)
+        return b"".join(
+            self._read(self._find("chunks", recipe[i : i + name_size]))
+            for i in range(0, len(recipe), name_size)
+        )
+
+    def add(self, named: Iterable) -> int:
+        """
+        Append the (name, bytes) pairs that aren't stored yet, return how
+        many there were
+        """
+
+        with open(self.path / "LOCK", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            # another writer may have added to the indexes since they were read
+            self._load()
+
+            recipes = {}
+            chunks = {}
+            for name, data in named:
+                key = multihash.from_b58_string(name)
+                if key in recipes or self._find("recipes", key):
+                    continue
+
+                recipe = []
+                for piece in chunk(data):
+                    digest = hashlib.sha256(piece).digest()
+                    piece_key = multihash.encode(digest, "sha2-256")
+                    if piece_key not in chunks and not self._find("chunks", piece_key):
+                        chunks[piece_key] = piece
+                    recipe.append(piece_key)
+                recipes[key] = b"".join(recipe)
+
+            if not recipes:
+                return 0
+
+            pack_path = self._pack_path(self.pack)
+            if pack_path.exists() and pack_path.stat().st_size >= self.pack_size:
+                self.pack += 1
+                pack_path = self._pack_path(self.pack)
+
+            retired = []
+            with open(pack_path, "ab") as f:
+                offset = f.tell()
+                for kind, new in [("chunks", chunks), ("recipes", recipes)]:
+                    if not new:
+                        continue
+                    entries = []
+                    for key, data in new.items():
+                        entries.append((key, self.pack, offset, len(data)))
+                        f.write(data)
+                        offset += len(data)
+                    retired += self._append_index(kind, sorted(entries))
+
+            # readers find the merged indexes before the retired ones disappear
+            self._write_manifest()
+            for index in retired:
+                index.close()
+                index.path.unlink()
+
+        return len(recipes)
+
+    def _append_index(self, kind: str, entries) -> list:
+        "index the entries, merge as needed, return the indexes merged away"
+
+        indexes = self.indexes[kind]
+        indexes.append(write_index(self._new_index_path(), entries))
+
+        retired = []
+        while len(indexes) > 1 and len(indexes[-2]) <= len(indexes[-1]):
+            older, newer = indexes[-2:]
+            indexes[-2:] = [merge_indexes(self._new_index_path(), [older, newer])]
+            retired += [older, newer]
+        return retired
+
+    def close(self):
+        self._close_indexes()
+        for pack in self.packs.values():
+            pack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class PrintStore:
+    """
+    Behavior shared by the fingerprint store backends: a bloom filter that
+    remembers which prefixes and fingerprints they contain
+    """
+
+    def _open_bloom(self, path):
+
+        self.bloom_path = Path(path)
+        fresh = not self.bloom_path.exists()
+        self.bloom = BloomFilter(self.bloom_path)
+
+        # the filter was lost, or the store predates it
+        if fresh and self.count():
+            self.rebuild_bloom()
+
+    def _tokens(self):
+        for channel, key in self._keys():
+            prefix, feature = split_key(channel, key)
+            yield prefix_token(channel, prefix)
+            yield print_token(channel, prefix, feature)
+
+    def rebuild_bloom(self):
+        capacity = max(self.bloom.capacity, 4 * self.count())
+        self.bloom.close()
+        self.bloom = rebuild(self.bloom_path, self._tokens(), capacity)
+
+    def _remember(self, p):
+        self.bloom.add(prefix_token(p.channel, p.prefix))
+        self.bloom.add(print_token(p.channel, p.prefix, p.feature))
+
+    def _remembered(self):
+        self.bloom.flush()
+        if self.bloom.saturated:
+            self.rebuild_bloom()
+
+    def might_contain_prefix(self, channel: int, prefix: int) -> bool:
+        return prefix_token(channel, prefix) in self.bloom
+
+    def might_contain(self, channel: int, prefix: int, feature: int) -> bool:
+        return print_token(channel, prefix, feature) in self.bloom
+
+    def stop_list(self, channel: int, keys: Iterable[int]) -> Set[int]:
+        """
+        Which of these fingerprints are too common to tell canvasses apart
+        (boilerplate text tends to produce them)
+        """
+
+        return {
+            key
+            for key, frequency in self.frequencies(channel, keys).items()
+            if frequency > self.stop_frequency
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class SqlitePrints(PrintStore):
+    """
+    fingerprints.use: sqlite3, the prints table
+
+    Fingerprints from degree 63 (and karp-rabin) channels go in the
+    wide_prints table instead, which keeps prefix and feature in separate
+    columns.
+    """
+
+    def __init__(self, config: dotdir.Config):
+
+        self.conn = sqlite3.connect(config.fingerprints.connect)
+        self.stop_frequency = config.fingerprints.stop_frequency
+        dotdir.create_tables(self.conn)
+        SqlitePrints.counter(self.conn, "prints")
+
+        # the store predates the frequency table
+        if (
+            self.count()
+            and not self.conn.execute("SELECT count(*) FROM frequency;").fetchone()[0]
+        ):
+            self.conn.execute(
+                "INSERT INTO frequency (channel, fingerprint, canvasses) "
+                "SELECT channel, fingerprint, count(distinct canvas_hash) "
+                "FROM prints GROUP BY channel, fingerprint;"
+            )
+            self.conn.commit()
+
+        self._open_bloom(Path(config.fingerprints.connect).with_suffix(".bloom"))
+
+    @staticmethod
+    def _schema(channel: int):
+        "table names, the columns that hold the key, and their values for a key"
+
+        if wide(channel):
+            return (
+                "wide_prints",
+                "wide_frequency",
+                "prefix, feature",
+                lambda key: split_key(channel, key),
+            )
+        return "prints", "frequency", "fingerprint", lambda key: (key,)
+
+    @staticmethod
+    def recount(conn) -> Dict[str, int]:
+        return {
+            "prints": sum(
+                conn.execute(f"SELECT count(*) FROM {table};").fetchone()[0]
+                for table in ["prints", "wide_prints"]
+            )
+        }
+
+    @staticmethod
+    def counter(conn, name: str) -> int:
+        "a running total (counted the slow way, the first time)"
+
+        found = conn.execute(
+            "SELECT value FROM counters WHERE name = ?;", (name,)
+        ).fetchone()
+        if found:
+            return found[0]
+
+        # the store predates the counters table
+        for counted, value in SqlitePrints.recount(conn).items():
+            conn.execute(
+                "INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?);",
+                (counted, value),
+            )
+        conn.commit()
+        return SqlitePrints.counter(conn, name)
+
+    def count(self) -> int:
+        return SqlitePrints.counter(self.conn, "prints")
+
+    def reindex(self) -> int:
+        for name, value in SqlitePrints.recount(self.conn).items():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?);",
+                (name, value),
+            )
+        self.conn.commit()
+        return self.count()
+
+    def _keys(self):
+        yield from self.conn.execute("SELECT channel, fingerprint FROM prints;")
+        for channel, prefix, feature in self.conn.execute(
+            "SELECT channel, prefix, feature FROM wide_prints;"
+        ):
+            yield channel, fingerprint_key(channel, prefix, feature)
+
+    def add(self, name: str, subcanvas_prints: Iterable):
+        """
+        Store the fingerprints of each subcanvas of the named canvas
+        """
+
+        cursor = self.conn.cursor()
+        found = set()
+        added = 0
+        for sub, fingerprints in enumerate(subcanvas_prints):
+            for p in fingerprints.prints():
+                prints, _, columns, values = self._schema(p.channel)
+                key = values(fingerprint_key(p.channel, p.prefix, p.feature))
+                found.add((p.channel, key))
+                match = " AND ".join(f"{c} = ?" for c in columns.split(", "))
+
+                # identical fingerprints are told apart by repeat_num
+                cursor.execute(
+                    f"SELECT coalesce(max(repeat_num) + 1, 0) FROM {prints} "
+                    f"WHERE channel = ? AND {match};",
+                    (p.channel, *key),
+                )
+                repeat_num = cursor.fetchone()[0]
+                cursor.execute(
+                    f"INSERT INTO {prints} "
+                    f"(channel, {columns}, repeat_num, canvas_hash, canvas, sub_idx, len) "
+                    f"VALUES (?, {', '.join('?' * len(key))}, ?, ?, ?, ?, ?);",
+                    (
+                        p.channel,
+                        *key,
+                        repeat_num,
+                        name,
+                        sub,
+                        p.begin,
+                        p.end - p.begin,
+                    ),
+                )
+                self._remember(p)
+                added += 1
+
+        # document frequency: count each canvas once per fingerprint
+        for channel, key in found:
+            _, frequency, columns, _ = self._schema(channel)
+            marks = ", ".join("?" * len(key))
+            match = " AND ".join(f"{c} = ?" for c in columns.split(", "))
+            cursor.execute(
+                f"INSERT OR IGNORE INTO {frequency} (channel, {columns}) "
+                f"VALUES (?, {marks});",
+                (channel, *key),
+            )
+            cursor.execute(
+                f"UPDATE {frequency} SET canvasses = canvasses + 1 "
+                f"WHERE channel = ? AND {match};",
+                (channel, *key),
+            )
+
+        # in the same transaction as the prints, so it can't drift
+        cursor.execute(
+            "UPDATE counters SET value = value + ? WHERE name = 'prints';", (added,)
+        )
+        self.conn.commit()
+        self._remembered()
+
+    def _select(self, channel: int, keys: Iterable[int], table: str, fields: str):
+        "rows for each of the keys, with the key (as an int) first"
+
+        _, _, columns, values = self._schema(channel)
+        width = len(columns.split(", "))
+        keys = list(set(keys))
+        step = max_variables // width
+        for i in range(0, len(keys), step):
+            chunk = keys[i : i + step]
+            marks = ", ".join(["(" + ", ".join("?" * width) + ")"] * len(chunk))
+            for row in self.conn.execute(
+                f"SELECT {columns}, {fields} FROM {table} "
+                f"WHERE channel = ? AND ({columns}) IN (VALUES {marks});",
+                [channel] + [v for key in chunk for v in values(key)],
+            ):
+                if width == 1:
+                    yield row
+                else:
+                    yield (fingerprint_key(channel, *row[:width]),) + row[width:]
+
+    def frequencies(self, channel: int, keys: Iterable[int]) -> Dict[int, int]:
+        _, frequency, _, _ = self._schema(channel)
+        return dict(self._select(channel, keys, frequency, "canvasses"))
+
+    def lookup(self, channel: int, keys: Iterable[int]) -> List[Row]:
+        prints, _, _, _ = self._schema(channel)
+        return [
+            Row(channel, key, *rest)
+            for key, *rest in self._select(
+                channel,
+                keys,
+                prints,
+                "repeat_num, canvas_hash, canvas, sub_idx, len",
+            )
+        ]
+
+    def close(self):
+        self.bloom.close()
+        self.conn.close()
+
+
+class SegmentPrints(PrintStore):
+    """
+    fingerprints.use: segments, where fingerprints.connect is a directory
+    of immutable index segments (see segments.py)
+
+    Each channel has its own segments, keyed by fingerprint.  Each call to
+    add writes a new segment.  Once a channel has merge_at of them, a
+    background thread merges them into one, so lookups stay a handful of
+    binary searches.
+
+    Several stores may be open on one directory (say, `gn serve` and a
+    cognizer), so everything that changes the MANIFEST or names happens
+    under a lock file, after catching up with what the others wrote.
+    """
+
+    merge_at = 8
+
+    def __init__(self, config: dotdir.Config):
+
+        self.path = Path(config.fingerprints.connect)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.stop_frequency = config.fingerprints.stop_frequency
+        self.manifest_path = self.path / "MANIFEST"
+        self.names_path = self.path / "names"
+        self.lock = threading.Lock()
+        self.merger = None
+
+        self.segments = {}
+        self.names = []
+        self.name_ids = {}
+        self.names_read = 0
+        with self._locked(shared=True):
+            self._load()
+
+        self._open_bloom(self.path / "fingerprints.bloom")
+
+    @contextmanager
+    def _locked(self, shared=False):
+        "hold the directory's lock (for other processes) and self.lock (threads)"
+
+        with self.lock, open(self.path / "LOCK", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+
+    def _manifest_stamp(self):
+        try:
+            stat = self.manifest_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        "catch up with the MANIFEST and names (the lock must be held)"
+
+        self.manifest_stamp = self._manifest_stamp()
+        if self.manifest_stamp:
+            manifest = json.loads(self.manifest_path.read_text())
+        else:
+            manifest = {"segments": {}, "next": 0}
+        self.next = manifest["next"]
+
+        # keep the segments that are still listed open, close the others
+        opened = {s.path.name: s for c in self.segments.values() for s in c}
+        self.segments = {
+            int(channel): [opened.pop(n, None) or Segment(self.path / n) for n in names]
+            for channel, names in manifest["segments"].items()
+        }
+        for segment in opened.values():
+            segment.close()
+
+        # the manifest predates counters
+        self.counters = manifest.get("counters") or self.recount()
+
+        # names are only ever appended
+        if self.names_path.exists():
+            with open(self.names_path, "rb") as f:
+                f.seek(self.names_read)
+                for name in f.read().decode("utf-8").split():
+                    self.name_ids[name] = len(self.names)
+                    self.names.append(name)
+                self.names_read = f.tell()
+
+    def _catch_up(self):
+        "reload, if another store has changed the MANIFEST since it was read"
+
+        if self._manifest_stamp() != self.manifest_stamp:
+            with self._locked(shared=True):
+                self._load()
+
+    def recount(self) -> Dict[str, int]:
+        return {
+            "prints": sum(
+                len(s) for segments in self.segments.values() for s in segments
+            )
+        }
+
+    def count(self) -> int:
+        return self.counters["prints"]
+
+    def reindex(self) -> int:
+        with self._locked():
+            self._load()
+            self.counters = self.recount()
+            self._write_manifest()
+        return self.count()
+
+    def _keys(self):
+        with self.lock:
+            segments = {c: list(s) for c, s in self.segments.items()}
+        for channel, channel_segments in segments.items():
+            for segment in channel_segments:
+                for key, _ in segment.entries():
+                    yield channel, key
+
+    def _new_segment_path(self):
+        path = self.path / f"{self.next:08d}.seg"
+        self.next += 1
+        return path
+
+    def _write_manifest(self):
+        staging = self.manifest_path.with_suffix(".new")
+        staging.write_text(
+            json.dumps(
+                {
+                    "segments": {
+                        channel: [s.path.name for s in segments]
+                        for channel, segments in self.segments.items()
+                    },
+                    "next": self.next,
+                    "counters": self.counters,
+                }
+            )
+        )
+        staging.replace(self.manifest_path)
+        self.manifest_stamp = self._manifest_stamp()
+
+    def _name_id(self, name):
+        "the lock must be held, and names loaded, so ids are line numbers"
+
+        if name not in self.name_ids:
+            self.name_ids[name] = len(self.names)
+            self.names.append(name)
+            with open(self.names_path, "ab") as f:
+                f.write((name + "\n").encode("utf-8"))
+                self.names_read = f.tell()
+        return self.name_ids[name]
+
+    def add(self, name: str, subcanvas_prints: Iterable):
+        """
+        Store the fingerprints of each subcanvas of the named canvas
+        """
+
+        # fingerprinting is the slow part, do it before taking the lock
+        found = [list(f.prints()) for f in subcanvas_prints]
+
+        crowded = False
+        with self._locked():
+            self._load()
+            canvas_id = self._name_id(name)
+
+            entries = defaultdict(list)
+            for sub, prints in enumerate(found):
+                for p in prints:
+                    key = fingerprint_key(p.channel, p.prefix, p.feature)
+                    entries[p.channel].append(
+                        (key, (canvas_id, sub, p.begin, p.end - p.begin))
+                    )
+                    self._remember(p)
+
+            for channel, channel_entries in entries.items():
+                words = 2 if wide(channel) else 1
+                segment = write_segment(
+                    self._new_segment_path(), sorted(channel_entries), words=words
+                )
+                self.segments.setdefault(channel, []).append(segment)
+                self.counters["prints"] += len(segment)
+                crowded |= len(self.segments[channel]) >= self.merge_at
+
+            self._write_manifest()
+
+        # (outside the lock, since rebuilding the bloom filter reads segments)
+        self._remembered()
+
+        if crowded and not (self.merger and self.merger.is_alive()):
+            self.merger = threading.Thread(target=self.merge, daemon=True)
+            self.merger.start()
+
+    def merge(self):
+        "combine each channel's current segments into one"
+
+        with self.lock:
+            channels = list(self.segments)
+
+        for channel in channels:
+
+            # claim a name for the merged segment, and open the victims
+            # privately, since another store may merge them away meanwhile
+            with self._locked():
+                self._load()
+                victims = [Segment(s.path) for s in self.segments.get(channel, [])]
+                if len(victims) < 2:
+                    for segment in victims:
+                        segment.close()
+                    continue
+                path = self._new_segment_path()
+                self._write_manifest()
+
+            merged = merge_segments(path, victims)
+            merged_away = {s.path.name for s in victims}
+            for segment in victims:
+                segment.close()
+
+            with self._locked():
+                self._load()
+                current = self.segments.get(channel, [])
+
+                # someone else merged some of these first, drop this merge
+                if not merged_away <= {s.path.name for s in current}:
+                    merged.close()
+                    merged.path.unlink()
+                    continue
+
+                self.segments[channel] = [merged] + [
+                    s for s in current if s.path.name not in merged_away
+                ]
+                self._write_manifest()
+                for segment in current:
+                    if segment.path.name in merged_away:
+                        segment.close()
+                        segment.path.unlink()
+
+    def frequencies(self, channel: int, keys: Iterable[int]) -> Dict[int, int]:
+        """
+        Segments don't keep a separate frequency table, so count the
+        distinct canvasses among each key's records (a canvas that repeats
+        itself has several records for the same key, in one segment or
+        spread across several)
+        """
+
+        self._catch_up()
+        queries = sorted(set(keys))
+        found = defaultdict(set)
+        with self.lock:
+            for segment in self.segments.get(channel, []):
+                for key, canvas_id in segment.canvas_ids(queries):
+                    found[key].add(canvas_id)
+        return {key: len(canvas_ids) for key, canvas_ids in found.items()}
+
+    def lookup(self, channel: int, keys: Iterable[int]) -> List[Row]:
+
+        self._catch_up()
+        queries = sorted(set(keys))
+        rows = []
+        with self.lock:
+            for segment in self.segments.get(channel, []):
+                repeats = Counter()
+                for i, key in segment.search(queries):
+                    canvas_id, sub, sub_idx, length = segment.record(i)
+                    rows.append(
+                        Row(
+                            channel,
+                            key,
+                            repeats[key],
+                            self.names[canvas_id],
+                            sub,
+                            sub_idx,
+                            length,
+                        )
+                    )
+                    repeats[key] += 1
+        return rows
+
+    def close(self):
+        if self.merger:
+            self.merger.join()
+        for segments in self.segments.values():
+            for segment in segments:
+                segment.close()
+        self.bloom.close()
+
+
+def open_store(config: dotdir.Config):
+
+    if config.fingerprints.use == "sqlite3":
+        return SqlitePrints(config)
+    if config.fingerprints.use == "segments":
+        return SegmentPrints(config)
+    raise NotImplementedError(f"fingerprints.use: {config.fingerprints.use}")
+
+
+def cognize(config: dotdir.Config, canvas: List[str], params=Params()) -> str:
+    """
+    Save the canvas and the fingerprints of its subcanvasses, return the
+    canvas hash
+    """
+
+    name = write_canvas(config, canvas)
+    with open_store(config) as store:
+        store.add(name, (all_subs(sub, params).fingerprints for sub in canvas))
+    return name
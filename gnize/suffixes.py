@@ -0,0 +1,124 @@
+"""
+# Purpose
+
+This module finds the places where text repeats, so that all_subs can
+avoid fingerprinting the same substrings twice.
+
+from_start only ever looks at the first few hundred characters after its
+offset (see Params.max_feature_len), call that its horizon.  Two offsets
+whose text agrees out to the horizon will produce the same fingerprints,
+just shifted.  Boilerplate, quoted replies, and repeated log lines are
+full of such offsets.
+
+A suffix array lists the offsets of a text in the sorted order of the
+suffixes that start there:
+
+    text: banana
+
+    offset   suffix    lcp
+         5   a           0
+         3   ana         1
+         1   anana       3
+         0   banana      0
+         4   na          0
+         2   nana        2
+
+The lcp column is the length of the prefix each suffix has in common with
+the one above it.  Suffixes which share a long prefix are neighbors, so
+a run of lcp's at or above the horizon is a group of offsets that only
+need to be fingerprinted once.
+"""
+
+from typing import Dict, List
+
+
+def suffix_array(text: str) -> List[int]:
+    """
+    Offsets of text, sorted by the suffix beginning there
+
+    Prefix doubling: once suffixes are ranked by their first k characters,
+    sorting by pairs of ranks (at i and i + k) ranks them by their first
+    2k.  O(n log^2 n), which is plenty for a few pages of text.
+    """
+
+    n = len(text)
+    order = list(range(n))
+    rank = [ord(c) for c in text]
+    k = 1
+
+    while n > 1:
+
+        def pair(i):
+            return rank[i], rank[i + k] if i + k < n else -1
+
+        order.sort(key=pair)
+
+        ranked = [0] * n
+        for previous, current in zip(order, order[1:]):
+            ranked[current] = ranked[previous] + (pair(previous) != pair(current))
+        rank = ranked
+
+        # every suffix has a rank of its own, so the order is final
+        if rank[order[-1]] == n - 1:
+            break
+        k *= 2
+
+    return order
+
+
+def lcp_array(text: str, order: List[int]) -> List[int]:
+    """
+    For each entry in the suffix array, the length of the prefix it shares
+    with the entry before it (Kasai's algorithm, O(n))
+    """
+
+    n = len(text)
+    rank = [0] * n
+    for position, offset in enumerate(order):
+        rank[offset] = position
+
+    lcp = [0] * n
+    common = 0
+    for offset in range(n):
+        if rank[offset] == 0:
+            common = 0
+            continue
+
+        # the suffix at offset + 1 shares at least common - 1 characters
+        # with its own predecessor, so there's no need to start over
+        other = order[rank[offset] - 1]
+        while (
+            offset + common < n
+            and other + common < n
+            and text[offset + common] == text[other + common]
+        ):
+            common += 1
+        lcp[rank[offset]] = common
+        common = max(0, common - 1)
+
+    return lcp
+
+
+def repeats(text: str, horizon: int) -> Dict[int, List[int]]:
+    """
+    Group the offsets whose text agrees for at least horizon characters.
+    Returns {first offset: [the other offsets]} for each group with more
+    than one member, all in ascending order.
+    """
+
+    order = suffix_array(text)
+    lcp = lcp_array(text, order)
+
+    groups = []
+    for position, offset in enumerate(order):
+        if position and lcp[position] >= horizon:
+            groups[-1].append(offset)
+        else:
+            groups.append([offset])
+
+    found = {}
+    for group in groups:
+        if len(group) > 1:
+            first, *others = sorted(group)
+            found[first] = others
+    return found
@@ -9,7 +9,6 @@ setup(
     author_email="gnize@matt.rixman.org",
     packages=["gnize"],
     python_requires=">=3.8",
-<<<<<<< Updated upstream
     install_requires=[
         "pyfinite",
         "prompt_toolkit",
@@ -18,20 +17,16 @@ setup(
         "dataclasses_json",
         "dacite",
         "py-multihash",
-        "miniseq",
-        "minineedle",
         "rich",
         "intervaltree",
         "pexpect",
         "tabulate",
     ],
-=======
-    install_requires=["pyfinite", "prompt_toolkit", "sortedcontainers", "pyyaml", "dataclasses_json", "dacite", "py-multihash", "miniseq", "minineedle", "rich", "intervaltree"],
->>>>>>> Stashed changes
     entry_points={
         "console_scripts": [
             "gn = gnize.cli:gn",
             "cog = gnize.cli:cog",
+            "recog = gnize.cli:recog",
         ]
     },
 )
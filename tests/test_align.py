@@ -0,0 +1,43 @@
+from gnize.align import Span, banded, locate
+from gnize.recog import Match
+
+
+def test_banded():
+
+    assert banded("kitten", "sitting", 2) == (3, 7)
+    assert banded("abc", "abcxyz", 2, free_end=True) == (0, 3)
+
+
+def test_locate_subcanvasses():
+
+    canvas = [
+        "This is the song that never ends yes it goes on",
+        "not knowing what it was",
+    ]
+    noise = (
+        "asdf45646546This is the song that nevr ends yes it goes on"
+        "__^%%$^%k not knowing what it was assxccjjasoad"
+    )
+
+    def anchor(sub, text):
+        return Match(
+            noise.index(text),
+            noise.index(text) + len(text),
+            sub,
+            canvas[sub].index(text),
+            len(text),
+        )
+
+    matches = [
+        anchor(0, "This is"),
+        anchor(0, "ends yes"),
+        anchor(1, "knowing"),
+        # a fingerprint collision, its text doesn't match
+        Match(0, 4, 1, 0, 4),
+    ]
+
+    first, second = locate(noise, canvas, matches)
+
+    assert first == Span(0, noise.index("This"), noise.index("__^"), 1)
+    assert noise[second.begin : second.end] == canvas[1]
+    assert second.edits == 0
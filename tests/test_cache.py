@@ -0,0 +1,46 @@
+import os
+
+from gnize import cache
+from gnize.features import Params, all_subs
+
+from tests.eunoia_a import noise
+
+
+def test_cached_result(tmp_path):
+
+    params = Params(parallel=False, cache=tmp_path)
+    found, stats = all_subs(noise, params)
+    assert not stats.cache_hits
+
+    again, stats = all_subs(noise, params)
+    assert stats.cache_hits
+    assert again.as_json() == found.as_json()
+    assert str(again) == str(found)
+
+    # the thresholds a quantile scan settled on are cached with its result
+    quantile = params.replace(selection="quantile")
+    _, chosen = all_subs(noise, quantile)
+    _, stats = all_subs(noise, quantile)
+    assert stats.cache_hits and chosen.feature_threshold is not None
+    assert (stats.prefix_threshold, stats.feature_threshold) == (
+        chosen.prefix_threshold,
+        chosen.feature_threshold,
+    )
+
+    # different parameters, different fingerprints
+    _, stats = all_subs(noise, Params(parallel=False, cache=tmp_path, channel=5))
+    assert not stats.cache_hits
+
+
+def test_least_recently_used_evicted(tmp_path):
+
+    cache.save(tmp_path, "a", b"x" * 10)
+    cache.save(tmp_path, "b", b"x" * 10)
+    os.utime(tmp_path / "a", (1, 1))
+    os.utime(tmp_path / "b", (2, 2))
+
+    # reading a makes b the least recently used
+    cache.load(tmp_path, "a")
+    cache.save(tmp_path, "c", b"x" * 10, capacity=20)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a", "c"]
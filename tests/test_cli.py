@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+root = Path(__file__).parent.parent
+
+# these take a while to import, or do things (like touch ~/.gnize) when
+# imported, `gn` shouldn't need them just to start up
+heavy = [
+    "gnize.cog",
+    "gnize.dotdir",
+    "gnize.store",
+    "prompt_toolkit",
+    "sqlite3",
+    "yaml",
+]
+
+# milliseconds, several times what it takes now
+budget = 150
+
+
+def python(code, home, stdin=None):
+    env = dict(os.environ, HOME=str(home), PYTHONPATH=str(root))
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        input=stdin,
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+
+
+def test_import_is_light(tmp_path):
+
+    run = python("import sys, gnize.cli; print(' '.join(sys.modules))", tmp_path)
+    loaded = set(run.stdout.split())
+    assert not loaded & set(heavy)
+    assert "gnize.features" not in loaded
+
+    # -X importtime's last line is the total for gnize.cli, in microseconds
+    cumulative = int(run.stderr.strip().splitlines()[-1].split("|")[1])
+    assert cumulative < budget * 1000
+
+
+def test_gn_leaves_dotdir_alone(tmp_path):
+
+    code = "import sys; sys.argv = ['gn', '-s', '-c']; from gnize.cli import gn; gn()"
+    run = python(code, tmp_path, stdin="Awkward grammar appals a craftsman. " * 3)
+
+    assert json.loads(run.stdout)
+    assert not (tmp_path / ".gnize").exists()
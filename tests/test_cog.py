@@ -0,0 +1,172 @@
+import random
+from time import perf_counter
+
+from gnize.cog import (
+    Data,
+    Kind,
+    Runs,
+    SubcanvasSummaryLexer,
+    find_targeted,
+    get_subcanvasses,
+    resubcanvas,
+    toggled,
+)
+
+
+def target(orig, change, cursor_pos, prev_selections=None):
+    ranges, _ = find_targeted(orig, change, cursor_pos, 0, [], prev_selections or [])
+    return ranges
+
+
+def test_deletion_at_cursor():
+
+    # x, x, x at the start of "hello world"
+    assert target("hello world", "ello world", 0) == [(0, 1)]
+    assert target("hello world", "hello", 5) == [(5, 11)]
+
+    # dd on the second line
+    assert target("ab\ncd\nef", "ab\nef", 3) == [(3, 6)]
+
+
+def test_deletion_before_cursor():
+
+    # X X with the cursor on "e"
+    assert target("abcdef", "abef", 4) == [(2, 4)]
+
+
+def test_repeated_characters():
+
+    # either "l" could have gone, the one under the cursor did
+    assert target("hello", "helo", 3) == [(3, 4)]
+    assert target("hello", "helo", 2) == [(2, 3)]
+
+
+def test_block_deletion():
+
+    # a visual block: the same column, on each line
+    orig = "abc\ndef\nghi"
+    selections = [(1, 2), (5, 6), (9, 10)]
+    assert target(orig, "ac\ndf\ngi", 1, selections) == selections
+
+
+def test_no_deletion():
+    assert target("hello", "hello", 2) == []
+    assert target("hello", "heallo", 2) == []
+
+
+def test_large_deletion():
+
+    noise = "\n".join(f"line {i} of the noise" for i in range(100000))
+    change = noise[:1000] + noise[-1000:]
+
+    start = perf_counter()
+    assert target(noise, change, 1000) == [(1000, len(noise) - 1000)]
+    assert perf_counter() - start < 0.1
+
+
+def test_runs():
+
+    runs = Runs(10)
+    runs.assign(2, 5, Kind.noise)
+    runs.assign(7, 20, Kind.noise)
+    assert list(runs.spans()) == [
+        (0, 2, Kind.signal),
+        (2, 5, Kind.noise),
+        (5, 7, Kind.signal),
+        (7, 10, Kind.noise),
+    ]
+    assert list(runs.spans(3, 8)) == [
+        (3, 5, Kind.noise),
+        (5, 7, Kind.signal),
+        (7, 8, Kind.noise),
+    ]
+
+    # neighbors of the same kind merge
+    runs.assign(5, 7, Kind.noise)
+    assert list(runs.spans()) == [(0, 2, Kind.signal), (2, 10, Kind.noise)]
+    assert "".join(k.name[0] for k in runs.kinds()) == "ssnnnnnnnn"
+
+
+def test_toggled():
+
+    noise = "hello world"
+    state = toggled(noise, None, [])
+    assert list(state.spans()) == [(0, 11, Kind.signal)]
+
+    toggled_off = toggled(noise, state, [(0, 6)])
+    assert [d.data for d in sorted(get_subcanvasses(noise, toggled_off))] == [
+        Data(Kind.noise, "hello "),
+        Data(Kind.signal, "world"),
+    ]
+
+    # the previous state is left alone, and toggling again restores it
+    assert list(state.spans()) == [(0, 11, Kind.signal)]
+    assert list(toggled(noise, toggled_off, [(0, 3)]).spans()) == [
+        (0, 3, Kind.signal),
+        (3, 6, Kind.noise),
+        (6, 11, Kind.signal),
+    ]
+
+
+def test_toggle_latency():
+
+    short = Runs(100)
+    long = Runs(10_000_000)
+    timings = []
+    for runs in [short, long]:
+        start = perf_counter()
+        for i in range(1000):
+            runs = toggled("", runs, [(i * 3 % 90, i * 3 % 90 + 5)])
+        timings.append(perf_counter() - start)
+    assert timings[1] < 10 * timings[0] + 0.1
+
+
+def test_resubcanvas():
+
+    random.seed(4)
+    noise = "".join(random.choice("ab \n") for _ in range(500))
+    state = toggled(noise, None, [])
+    it = get_subcanvasses(noise, state)
+
+    for _ in range(200):
+        ranges = []
+        for _ in range(random.choice([1, 1, 3])):
+            begin = random.randrange(len(noise))
+            ranges.append((begin, begin + random.randrange(1, 40)))
+        state = toggled(noise, state, ranges)
+        resubcanvas(noise, it, state, ranges)
+        assert sorted(it) == sorted(get_subcanvasses(noise, state))
+
+
+def test_summary():
+
+    noise = "x" * 1_000_000 + "\nend"
+    (interval,) = get_subcanvasses(noise, Runs(len(noise)))
+
+    start = perf_counter()
+    summary = interval.data.summary(interval, cursor_start=500, cursor_stop=600)
+    assert perf_counter() - start < 0.01
+
+    assert "".join(s.char for s in summary) == "xxxx... end"
+    assert [s.selected for s in summary] == [False] * 4 + [True] + [False] * 4
+
+    # no selection
+    summary = interval.data.summary(interval, cursor_start=2)
+    assert not any(s.selected for s in summary)
+
+
+def test_summaries_sorted_once():
+
+    noise = "ab" * 1000
+    state = Runs(len(noise))
+    for i in range(0, len(noise), 2):
+        state.assign(i, i + 1, Kind.noise)
+    SubcanvasSummaryLexer.it = get_subcanvasses(noise, state)
+    SubcanvasSummaryLexer.version += 1
+
+    ordered = SubcanvasSummaryLexer.ordered()
+    assert [i.begin for i in ordered] == list(range(len(noise)))
+    assert SubcanvasSummaryLexer.ordered() is ordered
+
+    SubcanvasSummaryLexer.version += 1
+    assert SubcanvasSummaryLexer.ordered() is not ordered
@@ -0,0 +1,176 @@
+import asyncio
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import FrozenInstanceError
+
+import pytest
+
+from gnize.features import (
+    Fingerprinter,
+    Params,
+    Signal,
+    all_subs,
+    concat,
+    fingerprint,
+    fingerprint_many,
+    fragment,
+    rolling,
+)
+
+from tests.eunoia_a import noise
+
+params = Params(parallel=False)
+
+
+@pytest.mark.parametrize("channel", [963, 31000, 63000, 61000])
+def test_concat_matches_digest(channel):
+
+    a = "Awkward grammar appals a craftsman. "
+    b = "‽¢ A Dada bard as daft as Tzara damns"
+    p = Params(parallel=False, channel=channel)
+
+    assert concat(fragment(a, p), fragment(b, p), p) == fragment(a + b, p)
+
+
+@pytest.mark.parametrize("channel", [31000, 63000])
+def test_density_across_families(channel):
+
+    # thresholds are scaled to the channel, so a wide channel should pick
+    # about as many substrings as a 16-bit one
+    narrow = all_subs(noise, params)
+    wide = all_subs(noise, params.replace(channel=channel))
+
+    searched = narrow.stats.fruitful_prefix_searches
+    assert searched / 1.5 < wide.stats.fruitful_prefix_searches < searched * 1.5
+
+    found = len(list(narrow.fingerprints.prints()))
+    assert found / 2 < len(list(wide.fingerprints.prints())) < found * 2
+
+
+def test_signal_edits():
+
+    subcanvasses = ["This is the song ", "that never ends ", "yes it goes on"]
+    signal = Signal(subcanvasses, params)
+    assert signal.fingerprint() == fragment("".join(subcanvasses), params)
+
+    signal.join(0)
+    signal.replace(1, "yes it goes on and on")
+    assert signal.fingerprint() == fragment(
+        "This is the song that never ends yes it goes on and on", params
+    )
+
+
+def test_repeats_reused():
+
+    quoted = noise + ("\n> " + noise[:400]) * 3
+    reused, stats = all_subs(quoted, params)
+    scanned, _ = all_subs(quoted, Params(parallel=False, reuse_repeats=False))
+
+    assert stats.repeated_offsets
+    assert reused.as_json() == scanned.as_json()
+
+
+def test_params_frozen():
+
+    with pytest.raises(FrozenInstanceError):
+        params.channel = 5
+
+    wide = params.replace(channel=31000)
+    assert (params.channel, wide.channel) == (963, 31000)
+    assert wide.channel_degree == 31
+    assert pickle.loads(pickle.dumps(wide)) == wide
+
+
+def test_parallel_matches_serial():
+
+    serial, _ = all_subs(noise, params)
+    parallel, _ = all_subs(noise, params.replace(parallel=True))
+    assert parallel.as_json() == serial.as_json()
+
+
+@pytest.mark.parametrize("channel", [963, 31000, 61000])
+def test_quantile_thresholds_agree(channel):
+
+    text = noise * 4
+    cognizer = Params(parallel=False, channel=channel, selection="quantile")
+    found, stats = all_subs(text, cognizer)
+    assert len(list(found.prints())) >= 10 * len(text) / 1000
+
+    # a recognizer using the reported thresholds finds the same fingerprints
+    recognizer = Params(
+        parallel=False,
+        channel=channel,
+        prefix_thresholds=(stats.prefix_threshold,),
+        feature_threshold=stats.feature_threshold,
+    )
+    assert all_subs(text, recognizer)[0].as_json() == found.as_json()
+
+
+@pytest.mark.parametrize("channel", [963, 63000, 61000])
+def test_rolling(channel):
+
+    text = noise[:100] + "¢‽ héllo wörld"
+    p = Params(parallel=False, channel=channel)
+    expected = [
+        fragment(text[i : i + 20], p).fingerprint for i in range(len(text) - 19)
+    ]
+    assert list(rolling(text, 20, p)) == expected
+
+
+def test_winnow_density():
+
+    text = noise * 4
+    p = params.replace(selection="winnow", kgram_len=20, winnow_window=30)
+    found = list(all_subs(text, p)[0].prints())
+
+    # every window of 30 substrings has a fingerprint
+    starts = [0] + [f.begin for f in found] + [len(text) - 20]
+    assert max(b - a for a, b in zip(starts, starts[1:])) <= 30
+    assert all(f.end - f.begin == 20 for f in found)
+
+
+def test_async_fingerprints():
+
+    texts = [line for line in noise.split("\n") if line]
+
+    async def scan(pool):
+        one = await fingerprint(noise, params, pool=pool)
+        many = [
+            progress async for progress in fingerprint_many(texts, params, pool=pool)
+        ]
+        return one, many
+
+    with ProcessPoolExecutor(2) as pool:
+        one, many = asyncio.run(scan(pool))
+
+    assert one.fingerprints.as_json() == all_subs(noise, params)[0].as_json()
+    assert sorted(p.index for p in many) == list(range(len(texts)))
+    assert [p.done for p in many] == list(range(1, len(texts) + 1))
+    for p in many:
+        expected = all_subs(texts[p.index], params)[0]
+        assert p.result.fingerprints.as_json() == expected.as_json()
+
+
+def test_async_deadline():
+
+    async def scan(pool):
+        async for _ in fingerprint_many(
+            [noise * 20] * 4, params, timeout=0.01, pool=pool
+        ):
+            pass
+
+    with ProcessPoolExecutor(1) as pool:
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(scan(pool))
+
+
+def test_fingerprinter_keeps_order():
+
+    texts = [noise[i : i + 80] for i in range(0, len(noise), 10)]
+    expected = [all_subs(text, params)[0].as_json() for text in texts]
+
+    with Fingerprinter(params.replace(parallel=True), 2, batch_chars=200) as f:
+        found = [result.fingerprints.as_json() for result in f.fingerprint_many(texts)]
+        assert f.fingerprint(texts[0]).fingerprints.as_json() == expected[0]
+
+    assert found == expected
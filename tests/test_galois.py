@@ -0,0 +1,41 @@
+from hashlib import sha256
+
+from gnize import galois
+
+
+def test_order_factors():
+
+    for n, factors in galois.order_factors.items():
+        product = 1
+        for q in factors:
+            product *= q
+        # 2^63 - 1 = 7^2 * ..., the repeated factor only needs listing once
+        while product < (1 << n) - 1:
+            product *= 7
+        assert product == (1 << n) - 1
+
+
+def test_wide_channels_are_primitive():
+
+    for family, n in [(galois.channel31, 31), (galois.channel63, 63)]:
+        assert len(set(family.values())) == len(family)
+        for polynomial in family.values():
+            assert galois.degree(polynomial) == n
+            assert galois.primitive(polynomial)
+
+
+def test_wide_channels_are_derived():
+
+    for family, n in [(galois.channel31, 31), (galois.channel63, 63)]:
+        for i, polynomial in enumerate(family.values()):
+            seed = sha256(b"gnize degree %d channel %d" % (n, i)).digest()
+            candidate = (1 << n) | int.from_bytes(seed, "big") % (1 << n) | 1
+            while not galois.primitive(candidate):
+                candidate += 2
+            assert candidate == polynomial
+
+
+def test_channel_numbers_dont_collide():
+
+    families = [galois.channel, galois.channel31, galois.channel63]
+    assert len(galois.channels) == sum(map(len, families))
@@ -0,0 +1,15 @@
+from hashlib import sha256
+
+from gnize import galois, karprabin
+
+
+def test_bases():
+
+    for i, (number, base) in enumerate(sorted(karprabin.channel.items())):
+        assert number == 61000 + i
+        seed = sha256(b"gnize karp-rabin %d" % i).digest()
+        assert base == int.from_bytes(seed, "big") % karprabin.modulus
+
+
+def test_channel_numbers_dont_collide():
+    assert not set(karprabin.channel) & set(galois.channels)
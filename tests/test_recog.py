@@ -0,0 +1,57 @@
+from collections import defaultdict
+
+from gnize.recog import Match, chain, rank, spans
+from gnize.store import Row
+
+
+class PostingStore:
+    "just enough of a fingerprint store to rank candidates with"
+
+    def __init__(self, postings):
+        self.postings = postings
+        self.looked_up = []
+
+    def lookup(self, channel, keys):
+        rows = []
+        for key in keys:
+            self.looked_up.append(key)
+            for name in self.postings[key]:
+                rows.append(Row(channel, key, 0, name, 0, 0, 1))
+        return rows
+
+
+def test_rank_stops_early():
+
+    # canvas "a" has every rare fingerprint, the rest share common ones
+    postings = defaultdict(list)
+    for key in range(40):
+        postings[key].append("a")
+    for key in range(1000, 1100):
+        postings[key].extend("bcdefghij")
+    frequencies = {key: len(names) for key, names in postings.items()}
+
+    store = PostingStore(postings)
+    leaders = rank(store, 963, frequencies, limit=1)
+    assert leaders[0].canvas_hash == "a"
+    assert len(store.looked_up) < len(postings)
+
+    everyone = rank(PostingStore(postings), 963, frequencies, limit=None)
+    assert leaders[0] == everyone[0]
+    assert len(everyone) == 10
+
+
+def test_chain_keeps_order():
+
+    # the second subcanvas appears after the first in the noise, plus one
+    # stray match, early in the noise, from the end of the second subcanvas
+    matches = [
+        Match(begin=5, end=10, canvas=1, sub_idx=30, len=5),
+        Match(begin=10, end=20, canvas=0, sub_idx=0, len=10),
+        Match(begin=30, end=40, canvas=0, sub_idx=20, len=10),
+        Match(begin=60, end=70, canvas=1, sub_idx=0, len=10),
+        Match(begin=80, end=90, canvas=1, sub_idx=20, len=10),
+    ]
+
+    found = chain(matches)
+    assert [m.begin for m in found] == [10, 30, 60, 80]
+    assert spans(found) == {0: (10, 40), 1: (60, 90)}
@@ -0,0 +1,90 @@
+import threading
+from dataclasses import replace
+
+import pytest
+
+from gnize import dotdir
+from gnize.features import Params, all_subs
+from gnize.serve import DaemonError, Server, request
+from gnize.store import cognize
+
+from tests.eunoia_a import noise
+
+overrides = {"parallel": False, "cache": None}
+
+
+@pytest.fixture
+def daemon(tmp_path):
+
+    config = replace(
+        dotdir.default_config,
+        canvasses=replace(dotdir.default_config.canvasses, path=str(tmp_path / "c")),
+        fingerprints=replace(
+            dotdir.default_config.fingerprints, connect=str(tmp_path / "prints.db")
+        ),
+    )
+    server = Server(tmp_path / "gn.sock", config)
+
+    # the store is opened in the thread that serves, so close it there too
+    def run():
+        with server:
+            server.serve_forever()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    assert not server.path.exists()
+
+
+def test_fingerprint(daemon):
+
+    texts = [noise, noise[:100]]
+    message = {"texts": texts, "params": overrides}
+    responses = list(request(daemon.path, message))
+
+    assert [r["index"] for r in responses] == [0, 1]
+    for text, response in zip(texts, responses):
+        expected = all_subs(text, Params(parallel=False))[0].as_json()
+        assert response["fingerprints"] == expected
+
+
+def test_one_pool(daemon):
+
+    texts = [noise[:300], noise[300:600]]
+    [response] = request(daemon.path, {"texts": texts[:1], "params": {"cache": None}})
+    assert daemon.workers is None
+
+    for channel in [5, 963]:
+        params = Params(parallel=False, channel=channel)
+        message = {"texts": texts, "params": {"cache": None, "channel": channel}}
+        for text, response in zip(texts, request(daemon.path, message)):
+            assert response["fingerprints"] == all_subs(text, params)[0].as_json()
+    workers = daemon.workers
+    assert workers is not None
+
+    message["params"]["channel"] = 6
+    list(request(daemon.path, message))
+    assert daemon.workers is workers
+
+
+def test_recog(daemon):
+
+    signal = noise.split("(what a scandal).")[0]
+    name = cognize(daemon.config, [signal], Params(parallel=False))
+
+    message = {"op": "recog", "noise": signal, "params": overrides, "locate": True}
+    [response] = request(daemon.path, message)
+    chain_len, votes, canvas_hash, spans = response["candidates"][0]
+    assert canvas_hash == name
+    assert spans[0][:3] == [0, 0, len(signal)]
+
+
+def test_errors_reported(daemon):
+
+    with pytest.raises(DaemonError, match="unknown params"):
+        list(request(daemon.path, {"texts": ["x"], "params": {"bogus": 1}}))
+
+    # the daemon is still there
+    assert list(request(daemon.path, {"texts": ["x"], "params": overrides}))
@@ -0,0 +1,225 @@
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from gnize import dotdir
+from gnize.bloom import BloomFilter, print_token, prefix_token
+from gnize.features import Params, all_subs
+from gnize.recog import recog
+from gnize.store import (
+    CanvasPacks,
+    canvas_count,
+    canvas_hash,
+    cognize,
+    fingerprint_key,
+    open_store,
+    read_canvas,
+    reindex,
+    stored_canvasses,
+    stored_prints,
+    write_canvas,
+    write_canvasses,
+)
+
+from tests.eunoia_a import noise
+
+params = Params(parallel=False)
+
+
+connect = {"sqlite3": "fingerprints.db", "segments": "segments"}
+
+
+@pytest.fixture(params=connect.keys())
+def config(tmp_path, request):
+    return replace(
+        dotdir.default_config,
+        canvasses=replace(dotdir.default_config.canvasses, path=str(tmp_path / "c")),
+        fingerprints=replace(
+            dotdir.default_config.fingerprints,
+            use=request.param,
+            connect=str(tmp_path / connect[request.param]),
+        ),
+    )
+
+
+def test_bloom_persists(tmp_path):
+
+    path = tmp_path / "prints.bloom"
+    with BloomFilter(path, capacity=100) as bf:
+        bf.add(prefix_token(963, 0x2F))
+
+    with BloomFilter(path) as bf:
+        assert prefix_token(963, 0x2F) in bf
+        assert print_token(963, 0x2F, 0x01) not in bf
+        assert bf.count == 1
+
+
+def test_recognize_cognized(config):
+
+    signal = noise.split("(what a scandal).")[0]
+    name = cognize(config, [signal], params)
+    assert read_canvas(config, name) == [signal]
+
+    with open_store(config) as store:
+        assert store.count()
+        candidates = recog("ads ads ads\n" + signal + "\nmore ads", store, params)
+
+    assert candidates[0].canvas_hash == name
+
+
+def test_bloom_rebuilt_when_missing(config):
+
+    signal = noise.split("(what a scandal).")[0]
+    cognize(config, [signal], params)
+
+    with open_store(config) as store:
+        store.bloom_path.unlink()
+
+    with open_store(config) as store:
+        assert recog(signal, store, params)
+
+
+def test_segments_merge(config):
+
+    if config.fingerprints.use != "segments":
+        pytest.skip("segments only")
+
+    lines = [line for line in noise.split("\n") if len(line) > 20]
+    names = [cognize(config, [line], params) for line in lines]
+
+    with open_store(config) as store:
+        store.merge()
+        assert len(store.segments[963]) == 1
+        total = store.count()
+
+    with open_store(config) as store:
+        assert store.count() == total
+        candidates = recog(lines[3], store, params)
+
+    assert candidates[0].canvas_hash == names[3]
+
+
+def test_stop_list(config):
+
+    boilerplate = "Click here to subscribe to our newsletter!"
+    lines = [line for line in noise.split("\n") if len(line) > 20]
+    for line in lines:
+        cognize(config, [line, boilerplate], params)
+
+    # one canvas that repeats itself, is still only one canvas
+    chorus = "This is the song that never ends, yes it goes on and on my friends"
+    sung = cognize(config, [chorus, chorus, chorus], params)
+
+    with open_store(config) as store:
+        assert len(recog(boilerplate, store, params, limit=None)) == len(lines)
+        keys = [
+            fingerprint_key(p.channel, p.prefix, p.feature)
+            for p in all_subs(chorus, params).fingerprints.prints()
+        ]
+        assert set(store.frequencies(params.channel, keys).values()) == {1}
+
+    config.fingerprints.stop_frequency = 2
+    with open_store(config) as store:
+        assert not recog(boilerplate, store, params)
+        assert recog(lines[0], store, params)[0].votes
+        assert recog(chorus, store, params)[0].canvas_hash == sung
+
+
+@pytest.mark.parametrize("channel", [31000, 63000, 61000])
+def test_wide_channels(config, channel):
+
+    wide = Params(parallel=False, channel=channel)
+    signal = noise.split("(what a scandal).")[0]
+    name = cognize(config, [signal], wide)
+    cognize(config, [signal], params)
+
+    with open_store(config) as store:
+        candidates = recog(signal, store, wide)
+
+    assert candidates[0].canvas_hash == name
+    assert candidates[0].chain
+
+
+def test_counters(config):
+
+    lines = [line for line in noise.split("\n") if len(line) > 20]
+    for line in lines[:3]:
+        cognize(config, [line], params)
+    cognize(config, [lines[0]], params)  # already stored
+
+    with open_store(config) as store:
+        prints = store.reindex()
+    assert prints == stored_prints(config)
+    assert canvas_count(config.canvasses.path) == 3
+
+    # the counts are kept, not recounted
+    (Path(config.canvasses.path) / "MANIFEST").write_text('{"canvasses": 7}')
+    assert canvas_count(config.canvasses.path) == 7
+    assert reindex(config) == (3, prints)
+    assert canvas_count(config.canvasses.path) == 3
+
+
+def test_packfile(config):
+
+    config.canvasses.use = "packfile"
+    lines = [line for line in noise.split("\n") if len(line) > 20]
+    names = write_canvasses(config, [[line] for line in lines[:5]])
+    names += write_canvasses(config, [[line] for line in lines[3:]])
+    assert names[3:5] == names[5:7]  # stored once
+
+    # merged as they were added
+    with CanvasPacks(config.canvasses.path) as packs:
+        assert len(packs.indexes["recipes"]) < 3
+        assert packs.count() == len(lines)
+    assert len(list(Path(config.canvasses.path).glob("*.idx"))) < 5
+
+    for line in lines:
+        assert read_canvas(config, canvas_hash([line])) == [line]
+    with pytest.raises(KeyError):
+        read_canvas(config, canvas_hash(["never stored"]))
+
+    signal = noise.split("(what a scandal).")[0]
+    name = cognize(config, [signal], params)
+    with open_store(config) as store:
+        assert recog(signal, store, params)[0].canvas_hash == name
+    assert stored_canvasses(config) == len(lines) + 1
+
+
+def test_packfile_chunks(config):
+
+    config.canvasses.use = "packfile"
+    pack = Path(config.canvasses.path) / "00000000.pack"
+    text = " ".join(f"word{i * 7919 % 1000}" for i in range(4000))
+    edited = text[:15000] + " an edit " + text[15000:]
+
+    write_canvasses(config, [[text]])
+    before = pack.stat().st_size
+    name = write_canvas(config, [edited, "and another subcanvas"])
+
+    # only the chunks near the edit are new
+    assert pack.stat().st_size - before < len(text) // 4
+    assert read_canvas(config, name) == [edited, "and another subcanvas"]
+
+
+def test_segments_shared(config):
+
+    if config.fingerprints.use != "segments":
+        pytest.skip("segments only")
+
+    lines = [line for line in noise.split("\n") if len(line) > 20]
+    names = [write_canvas(config, [line]) for line in lines[:2]]
+
+    # e.g. gn serve has the store open while a cognizer writes to it
+    with open_store(config) as first, open_store(config) as second:
+        first.add(names[0], [all_subs(lines[0], params).fingerprints])
+        second.add(names[1], [all_subs(lines[1], params).fingerprints])
+        assert recog(lines[0], second, params)[0].canvas_hash == names[0]
+        first.merge()
+        assert recog(lines[1], second, params)[0].canvas_hash == names[1]
+
+    with open_store(config) as store:
+        assert store.names == names
+        assert len(store.segments[963]) == 1
+        for line, name in zip(lines, names):
+            assert recog(line, store, params)[0].canvas_hash == name
@@ -0,0 +1,15 @@
+from gnize.suffixes import lcp_array, repeats, suffix_array
+
+
+def test_banana():
+
+    order = suffix_array("banana")
+    assert order == [5, 3, 1, 0, 4, 2]
+    assert lcp_array("banana", order) == [0, 1, 3, 0, 0, 2]
+
+
+def test_repeats():
+
+    text = "spam and eggs, spam and ham"
+    assert repeats(text, 9) == {0: [15]}
+    assert repeats(text, 10) == {}